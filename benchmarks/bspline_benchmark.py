@@ -0,0 +1,59 @@
+"""
+Benchmark geometry.b_spline_to_bezier_series (all Bezier curves at once, by blossoming) against
+the previous version, which inserted each knot with fitpack.insert, on splines fitted to strokes
+of 100 to 20k points.
+
+Run from the repository root:  python -m benchmarks.bspline_benchmark
+"""
+import argparse
+
+import numpy as np
+import scipy.interpolate
+import scipy.interpolate.fitpack as fitpack
+
+from vectorbrush import geometry
+from benchmarks.common import stroke, timeit
+
+
+def legacyBSplineToBezierSeries(tck, per=False):
+    """ The knot insertion implementation (by Zachary Pincus) that b_spline_to_bezier_series replaced """
+    t, c, k = tck
+    t = np.asarray(t)
+    new_tck = tck
+    if per:
+        knots_to_consider = np.unique(t[k:-k])
+    else:
+        knots_to_consider = np.unique(t[k + 1:-k - 1])
+    desired_multiplicity = k + 1
+    for x in knots_to_consider:
+        current_multiplicity = np.sum(t == x)
+        remainder = current_multiplicity % desired_multiplicity
+        if remainder != 0:
+            number_to_insert = desired_multiplicity - remainder
+            new_tck = fitpack.insert(x, new_tck, number_to_insert, per)
+    tt, cc, kk = new_tck
+    bezier_points = np.transpose(cc)
+    if len(bezier_points) > desired_multiplicity:
+        bezier_points = bezier_points[:-desired_multiplicity]
+    if per:
+        bezier_points = bezier_points[k:-k]
+    return np.split(bezier_points, len(bezier_points) / desired_multiplicity, axis=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000, 20000])
+    parser.add_argument('--smoothness', type=float, default=5)
+    args = parser.parse_args(argv)
+
+    print('{:>8} {:>8} {:>12} {:>12} {:>8}'.format('points', 'knots', 'legacy (s)', 'new (s)', 'speedup'))
+    for n in args.sizes:
+        tck, _ = scipy.interpolate.splprep(stroke(n).T, s=args.smoothness * n)
+        legacyTime, legacy = timeit(legacyBSplineToBezierSeries, tck)
+        newTime, curves = timeit(geometry.b_spline_to_bezier_series, tck)
+        assert np.allclose(np.array(legacy), curves), 'results differ'
+        print('{:>8} {:>8} {:>12.4f} {:>12.4f} {:>7.1f}x'.format(n, len(tck[0]), legacyTime, newTime, legacyTime / newTime))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+import time
+
+import numpy as np
+
+
+def stroke(n, seed=0):
+    """ A gaze-like stroke: a random walk with 3px steps """
+    return np.cumsum(np.random.RandomState(seed).normal(scale=3, size=(n, 2)), axis=0)
+
+
+def timeit(f, *args):
+    """ Call f(*args), and return the time taken (s) and the result """
+    start = time.perf_counter()
+    result = f(*args)
+    return time.perf_counter() - start, result
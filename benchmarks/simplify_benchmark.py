@@ -0,0 +1,63 @@
+"""
+Benchmark BezierPath.simplify (iterative, array-based RDP) against the previous recursive
+implementation, on random-walk strokes of 1k to 100k points.
+
+Run from the repository root:  python -m benchmarks.simplify_benchmark
+"""
+import sys
+import argparse
+
+import numpy as np
+
+from vectorbrush import geometry
+from vectorbrush.bezier import BezierPath
+from benchmarks.common import stroke, timeit
+
+
+def legacySimplify(path, threshold):
+    """ The recursive QPainterPath implementation that BezierPath.simplify replaced """
+    if path.elementCount() <= 2:
+        return path
+
+    maximumDistance = 0.0
+    maximumIndex = 0
+    for i in range(1, path.elementCount() - 1):
+        distance = geometry.distancePointToLine(path.pointAtIndex(i), path.pointAtIndex(0), path.pointAtIndex(path.elementCount() - 1))
+        if distance > maximumDistance:
+            maximumDistance = distance
+            maximumIndex = i
+
+    if maximumDistance >= threshold:
+        results1 = legacySimplify(path.subpathWithRange(range(0, maximumIndex + 1)), threshold)
+        results2 = legacySimplify(path.subpathWithRange(range(maximumIndex, path.elementCount())), threshold)
+        results1.appendPath(results2.subpathWithRange(range(1, results2.elementCount())))
+        return results1
+    else:
+        simplified = BezierPath()
+        simplified.moveTo(path.pointAtIndex(0))
+        simplified.lineTo(path.pointAtIndex(path.elementCount() - 1))
+        return simplified
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 3000, 10000, 30000, 100000])
+    parser.add_argument('--threshold', type=float, default=5)
+    parser.add_argument('--legacy-max', type=int, default=100000, help='largest stroke to run the old implementation on')
+    args = parser.parse_args(argv)
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * max(args.sizes)))
+    print('{:>8} {:>8} {:>12} {:>12} {:>8}'.format('points', 'kept', 'legacy (s)', 'new (s)', 'speedup'))
+    for n in args.sizes:
+        path = BezierPath.pathFromXY(stroke(n))
+        newTime, simplified = timeit(path.simplify, args.threshold)
+        if n <= args.legacy_max:
+            legacyTime, legacy = timeit(legacySimplify, path, args.threshold)
+            assert np.allclose(legacy.getXY(), simplified.getXY()), 'results differ'
+            print('{:>8} {:>8} {:>12.4f} {:>12.4f} {:>7.1f}x'.format(n, simplified.elementCount(), legacyTime, newTime, legacyTime / newTime))
+        else:
+            print('{:>8} {:>8} {:>12} {:>12.4f} {:>8}'.format(n, simplified.elementCount(), '-', newTime, '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,5 @@
 import sys
 import logging
-import datetime
 import importlib
 
 from PySide import QtCore, QtGui
@@ -13,53 +12,78 @@ from scipy.optimize import curve_fit
 
 
 import gazecontour.realtime
+import gazecontour.images
 from gazecontour import basewindow
 from gazecontour.recorder import Recorder
-from vectorbrush import bezier
+from gazecontour import metrics
+from gazecontour.decimation import MinMaxPyramid, SlidingWindow, decimate
+from gazecontour.pipeline import Pipeline
+from gazecontour.diskcache import DiskCache, digest
+from gazecontour import session
+from gazecontour.livetail import LiveTail
+from gazecontour.redraw import RedrawScheduler, Timing
+from gazecontour.playback import Playback, SPEEDS
+from vectorbrush.pathdata import PathData
 
 
 logger = logging.getLogger(__name__)
 
+# Increase when the results of AnalysisWindow.analyze change, so cached results are not reused
+ANALYSIS_VERSION = 1
+
+# Length of the time region first selected in a windowed session, in seconds
+INITIAL_WINDOW_SECS = 60
+
+# Interval between updates when following a recording in progress, in ms
+LIVE_UPDATE_MSECS = 100
+
 
 class AnalysisWindow(basewindow.BaseMainWindow):
     """
     Widget which analyzes previously recorded gaze gazeData
     """
 
+    def initSignals(self):
+        """
+        Declare the signals derived from the recorded data. They are computed only when needed
+        (see Pipeline)
+        """
+        self.signals = Pipeline(cache=self.resultCache)
+
+        @self.signals.node('speed', inputs=('time', 'avg_x', 'avg_y'))
+        def speed(t, x, y):
+            return gazecontour.realtime.gazeSpeed(t, x, y)
+
+        @self.signals.node('fixations', inputs=('raw_x', 'raw_y'), N=15, px_thresh=100)
+        def fixations(x, y, N, px_thresh):
+            # N = length of buffer, px_thresh = pixel distance threshold for saccades
+            # This is actually post-processing, but simulate real-time
+            p = gazecontour.realtime.GazeProcessor(N, px_thresh)
+            return p.process_arrays(x, y)
+
     def initPlotItems(self):
         """
-        Set up the appearances and plotting functions of items in the gaze plot
+        Set up the appearances and plotting functions of items in the gaze plot.
+        Plotting functions take the signals Pipeline.
         """
         @self.plotElement('raw', pyqtgraph.PlotDataItem(symbol='o', symbolSize=3, symbolBrush='r', pen={'color':'e36', 'width':1}, symbolPen=None))
-        def plot_raw(df):
-            return (df['raw_x'], df['raw_y'])
+        def plot_raw(signals):
+            return (signals['raw_x'], signals['raw_y'])
 
         @self.plotElement('avg', pyqtgraph.PlotDataItem(symbol='o', symbolSize=5, symbolBrush='b', pen={'color':'88b', 'width':1}, symbolPen=None))
-        def plot_avg(df):
-            return (df['avg_x'], df['avg_y'])
+        def plot_avg(signals):
+            return (signals['avg_x'], signals['avg_y'])
 
         @self.plotElement('cursor', pyqtgraph.PlotDataItem(symbol='+', symbolSize=5, symbolBrush='g', pen={'color':'ada', 'width':1}, symbolPen=None))
-        def plot_cursor(df):
-            return (df['cursor_x'], df['cursor_y'])
+        def plot_cursor(signals):
+            return (signals['cursor_x'], signals['cursor_y'])
 
         @self.plotElement('fix', pyqtgraph.PlotDataItem(symbol='o', symbolSize=5, symbolBrush='c', pen={'color':'99f', 'width':1}, symbolPen=None))
-        def fixations(df):
-            N = 15 # length of buffer
-            px_thresh= 100 # pixel distance threshold for saccades
-                        
-            # This is actually post-processing, but simulate real-time
-            p = gazecontour.realtime.GazeProcessor(N, px_thresh)
-            
-            (fixation_x, fixation_y) = p.process_dataframe(df)
-                                  
-            
-            # for output
-            df['fixation_x'] = pandas.Series(fixation_x, index=df.index)
-            df['fixation_y'] = pandas.Series(fixation_y, index=df.index)
-            return (df['fixation_x'], df['fixation_y'])
+        def fixations(signals):
+            return signals['fixations']
         
         @self.plotElement('path', pyqtgraph.PlotDataItem(symbol='x', symbolSize=5, symbolBrush='m', pen={'color':'4B0082', 'width':1}, symbolPen=None))
-        def plot_path(df):
+        def plot_path(signals):
             pass
         
         self.stimItem = None
@@ -71,7 +95,15 @@ class AnalysisWindow(basewindow.BaseMainWindow):
         self.recorder = recorder
 
         self.gazeData = pandas.DataFrame()
+        self.times = np.empty(0) # time of each sample in gazeData, in seconds from the start
+        self.duration = 0
+        self.session = None # WindowedSession, if gazeData holds only a window of the session
+        self.windowStart = self.windowStop = 0 # rows of the session in gazeData
+        self.live = None # LiveTail, if following a recording in progress
+        self.followAction = None
         self.path = None
+        self.overlapCellSize = 0.5 # px, resolution of the masks used to score overlap
+        self.resultCache = DiskCache() # derived signals and analysis results, kept between runs
 
         pyqtgraph.setConfigOption('background', 'w')
         pyqtgraph.setConfigOption('foreground', 'k')
@@ -96,9 +128,15 @@ class AnalysisWindow(basewindow.BaseMainWindow):
         self.gazePlot.setAspectLocked(ratio=1)
         self.gazePlot.disableAutoRange()
 
+        # Moving the region only asks for a redraw; redraws are made at most once per display
+        # frame, for the latest region
         self.regionBeingDragged = False
+        self.redraw = RedrawScheduler(self.updatePlot, parent=self)
         self.timeRegion.sigRegionChanged.connect(self.handleRegionChanged)
         self.timeRegion.sigRegionChangeFinished.connect(self.handleRegionChangeFinished)
+        self.speedCurve = None
+        self.speedTimes = self.speed = np.empty(0)
+        self.speedPlot.sigXRangeChanged.connect(self.updateSpeedPlot)
 
 
         self.setCentralWidget(analysisWidget)
@@ -109,13 +147,27 @@ class AnalysisWindow(basewindow.BaseMainWindow):
             self.toolbar.addAction(loadRecAction)
             loadRecAction.triggered.connect(self.loadFromRecorder)
 
+            self.followAction = QtGui.QAction(self.style().standardIcon(QtGui.QStyle.SP_MediaSeekForward), 'Follow rec.', self)
+            self.followAction.setCheckable(True)
+            self.toolbar.addAction(self.followAction)
+            self.followAction.toggled.connect(self.setFollowing)
+            self.liveTimer = QtCore.QTimer(self)
+            self.liveTimer.setInterval(LIVE_UPDATE_MSECS)
+            self.liveTimer.timeout.connect(self.updateLive)
+
         loadFileAction = QtGui.QAction(self.style().standardIcon(QtGui.QStyle.SP_DirHomeIcon), 'Load file', self)
         self.toolbar.addAction(loadFileAction)
         loadFileAction.triggered.connect(self.loadFile)
 
+        exportAction = QtGui.QAction(self.style().standardIcon(QtGui.QStyle.SP_DialogSaveButton), 'Export', self)
+        exportAction.setToolTip('Save the recorded and derived signals (speed, fixations) as CSV')
+        self.toolbar.addAction(exportAction)
+        exportAction.triggered.connect(self.exportSignals)
+
         # Set up plot items and add checkboxes to the toolbar
         self.plotElements = {}
         self.toolbar.addSeparator()
+        self.initSignals()
         self.initPlotItems()
         
         self.initPlayAnimation()
@@ -123,64 +175,32 @@ class AnalysisWindow(basewindow.BaseMainWindow):
         
     def initPlayAnimation(self):
         """
-        Initialize actions, timer, and buttons for play/pause/stop animation of the
-        gaze plot
+        Initialize the playback engine, and the play/pause/stop buttons and speed
+        selection for the animation of the gaze plot
         """
-        
-        # Start a timer for "play" animation Note QTimer is not reliable in its
-        # interval, thus we use an elapsedTimer to calculate the correct
-        # animation size
-        self.animTimer = QtCore.QTimer(self)
-        self.animTimer.setInterval(1000.0 / 30) # 30 fps, not precise -- will be somewhat less
-        self.animElapsedTimer = QtCore.QElapsedTimer()
-        self.animElapsedTimer.start()
+        self.playback = Playback(self.timeRegion, parent=self)
+        # Draw each frame of playback as soon as the region has moved
+        self.playback.sigAdvanced.connect(self.redraw.flush)
+        self.playback.sigStateChanged.connect(lambda playing: playing or self.logUpdateTimings())
 
         # Play/stop buttons
         playAct = QtGui.QAction(self.style().standardIcon(QtGui.QStyle.SP_MediaPlay), 'Play', self)
         pauseAct = QtGui.QAction(self.style().standardIcon(QtGui.QStyle.SP_MediaPause), 'Pause', self)
         stopAct = QtGui.QAction(self.style().standardIcon(QtGui.QStyle.SP_MediaStop), 'Stop', self)
+        playAct.triggered.connect(self.playback.play)
+        pauseAct.triggered.connect(self.playback.pause)
+        stopAct.triggered.connect(self.playback.stop)
+
+        speedBox = QtGui.QComboBox(self)
+        speedBox.setToolTip('Playback speed')
+        for speed in SPEEDS:
+            speedBox.addItem('{:g}x'.format(speed), speed)
+        speedBox.setCurrentIndex(SPEEDS.index(1.0))
+        speedBox.currentIndexChanged.connect(lambda i: self.playback.setSpeed(SPEEDS[i]))
 
-        def pauseRegion():
-            self.animTimer.stop()
-            self.timeRegion.lineMoveFinished()
-        def stopRegion():
-            self.animTimer.stop()
-            x1, x2 = self.timeRegion.getRegion()
-            self.timeRegion.setRegion((0, x2 - x1))
-
-        def _setRegionDirect(r, rgn):
-                if r.lines[0].value() == rgn[0] and self.lines[1].value() == rgn[1]:
-                    return
-                r.blockLineSignal = True
-                r.lines[0].setValue(rgn[0])
-                r.blockLineSignal = False
-                r.lines[1].setValue(rgn[1])
-                r.lineMoved()
-
-        def advanceRegion():
-            # Call out own version of setRegion because we don't want to emit sigRegionChangeFinished
-            try:
-                frameSecs = self.animElapsedTimer.restart() / 1000.0
-                print(frameSecs)
-                x1, x2 = self.timeRegion.getRegion()
-                if x1 < self.gazeData['time'][-1]:
-                    _setRegionDirect(self.timeRegion, (x1 + frameSecs, x2 + frameSecs))
-                else:
-                    pauseRegion()
-            except KeyError:
-                pauseRegion()
-        def playRegion():
-            self.animElapsedTimer.restart()
-            self.animTimer.start()
-
-        self.animTimer.timeout.connect(advanceRegion)
-        playAct.triggered.connect(playRegion)
-        pauseAct.triggered.connect(self.animTimer.stop)
-        stopAct.triggered.connect(stopRegion)
         self.toolbar.addSeparator()
         self.toolbar.addActions([playAct, pauseAct, stopAct])
-
-
+        self.toolbar.addWidget(speedBox)
 
     class PlotElementWrapper(object):
         """ convenience wrapper for a plot item with 'enable' checkbox """
@@ -190,36 +210,116 @@ class AnalysisWindow(basewindow.BaseMainWindow):
             self.checkbox = checkbox
             self.dataFunc = dataFunc
             self.parent = parent
-            self.data = (pandas.DataFrame(), pandas.DataFrame())
+            self.signals = None
+            self.data = None # (x, y) arrays, one value per sample, computed when first shown
+            self.pyramids = None # MinMaxPyramids of x and y, to draw long intervals at screen resolution
+            self.drawn = None # what was last drawn: samples, symbol and plot widths, or None to draw again
+            self.hidden = False
+            self.window = None # SlidingWindow of the samples drawn during playback
+            self.timing = Timing()
             try:
                 self.origSymbol = self.plotItem.opts['symbol']
             except AttributeError: #this type of item has no symbol
                 self.origSymbol = None
         
-        def loadData(self, df):
-            self.data = self.dataFunc(df)
+        def loadData(self, signals):
+            """ Use the signals of a new session; the data is computed when the element is first shown """
+            self.signals = signals
+            self.data = self.pyramids = self.drawn = self.window = None
 
-        def update(self, timeSlice):
+        def extend(self, changedFrom):
             """
-            Called while dragging the time region and after loading data. Update
-            the plot, but if dragging first set to plot as lines (not with
-            symbols) to avoid pyqtgraph's performance issues with scatter plots
+            Take in the samples appended to live signals, whose values changed from sample
+            changedFrom on: only those are added to the pyramids
             """
-            if self.checkbox.isChecked():
-                self.plotItem.show()
-                self.xPlotItem.show()
-                try:
-                    if self.data and len(self.data[0]):
-                        data = (self.data[0][timeSlice], self.data[1][timeSlice])
-                        opts = {'symbol' : None if self.parent.regionBeingDragged else self.origSymbol}
-                        self.plotItem.setSymbol(opts['symbol'])
-                        self.plotItem.setData(*data, opts=opts)
-                        self.xPlotItem.setData(self.parent.gazeData['time'][timeSlice], data[0])
-                except AttributeError: # e.g. ImageItems have no symbols
-                    pass
+            if self.data is None:
+                return # computed in full when first shown
+            data = self.dataFunc(self.signals)
+            if data is None:
+                self.data = self.pyramids = None
             else:
-                self.plotItem.hide()
-                self.xPlotItem.hide()
+                self.data = tuple(np.asarray(d, dtype=float) for d in data)
+                for p, d in zip(self.pyramids, self.data):
+                    p.update(d, changedFrom)
+            self.drawn = self.window = None
+
+        def _computeData(self):
+            data = self.dataFunc(self.signals)
+            if data is not None:
+                data = tuple(np.asarray(d, dtype=float) for d in data)
+                self.pyramids = [MinMaxPyramid(d) for d in data]
+            self.data = data
+
+        def update(self, start, stop):
+            """
+            Called while dragging the time region and after loading data. Plot
+            samples start to stop, but if dragging first set to plot as lines
+            (not with symbols) to avoid pyqtgraph's performance issues with
+            scatter plots. Long intervals are decimated to about the width of
+            each plot in pixels, keeping the extremes. Nothing is redrawn if
+            none of these changed since the last update.
+            """
+            if not self.checkbox.isChecked():
+                if not self.hidden:
+                    self.plotItem.hide()
+                    self.xPlotItem.hide()
+                    self.hidden = True
+                self.drawn = self.window = None
+                return
+            if self.parent.playback.isPlaying():
+                self.timing.timed(self._play, start, stop)
+                self.drawn = None
+                return
+            self.window = None
+            symbol = None if self.parent.regionBeingDragged else self.origSymbol
+            gazeWidth = self.parent.plotWidth(self.parent.gazePlot)
+            xWidth = self.parent.plotWidth(self.parent.xPlot)
+            state = (int(start), int(stop), symbol, gazeWidth, xWidth)
+            if state == self.drawn:
+                return
+            self.timing.timed(self._draw, start, stop, symbol, gazeWidth, xWidth)
+            self.drawn = state
+
+        def _play(self, start, stop):
+            """
+            Draw the next frame of playback, moving a SlidingWindow along instead of taking
+            the samples of the whole region again, and without symbols
+            """
+            if self.data is None and self.signals is not None:
+                self._computeData()
+            if not self.data or not len(self.data[0]):
+                return
+            try:
+                if self.window is None or not self.window.follows(start, stop):
+                    x, y = self.data
+                    width = max(self.parent.plotWidth(self.parent.gazePlot), self.parent.plotWidth(self.parent.xPlot))
+                    self.window = SlidingWindow(self.pyramids, [x, y, self.parent.times], start, stop, width)
+                    self.plotItem.show()
+                    self.xPlotItem.show()
+                    self.hidden = False
+                    self.plotItem.setSymbol(None)
+                x, y, t = self.window.advance(start, stop)
+                self.plotItem.setData(x, y)
+                self.xPlotItem.setData(t, x)
+            except AttributeError: # e.g. ImageItems have no symbols
+                pass
+
+        def _draw(self, start, stop, symbol, gazeWidth, xWidth):
+            self.plotItem.show()
+            self.xPlotItem.show()
+            self.hidden = False
+            try:
+                if self.data is None and self.signals is not None:
+                    self._computeData()
+                if self.data and len(self.data[0]):
+                    x, y = self.data
+                    samples = decimate(self.pyramids, start, stop, gazeWidth)
+                    self.plotItem.setSymbol(symbol)
+                    self.plotItem.setData(x[samples], y[samples], opts={'symbol': symbol})
+                    samples = self.pyramids[0].indices(start, stop, xWidth)
+                    self.xPlotItem.setData(self.parent.times[samples], x[samples])
+            except AttributeError: # e.g. ImageItems have no symbols
+                pass
 
 
     def plotElement(self, name, plotItem):
@@ -236,7 +336,7 @@ class AnalysisWindow(basewindow.BaseMainWindow):
         checkbox = QtGui.QCheckBox(name.capitalize(), self)
         self.toolbar.addWidget(checkbox)
         checkbox.setChecked(True)
-        checkbox.toggled.connect(self.updatePlot)
+        checkbox.toggled.connect(self.redraw.request)
 
         def decorator(f):
             """ Process the plotting function being decorated"""
@@ -246,64 +346,151 @@ class AnalysisWindow(basewindow.BaseMainWindow):
 
     def handleRegionChanged(self):
         self.regionBeingDragged = True
-        self.updatePlot()
+        self.redraw.request()
 
     def handleRegionChangeFinished(self):
         self.regionBeingDragged = False
-        self.updatePlot()
+        self.redraw.request()
+        self.logUpdateTimings()
 
     def updatePlot(self):
         """
         Replot gaze, showing points only between minSecs and maxSecs in the recording
         """
         minSecs, maxSecs = self.timeRegion.getRegion()
-        if len(self.gazeData) > 0:
-            timeSlice = slice(self.gazeData.index[0] + datetime.timedelta(seconds=minSecs),
-                              self.gazeData.index[0] + datetime.timedelta(seconds=maxSecs))
-            # TODO: can optimize this
+        if self.session is not None:
+            # Read the rows in the interval if they are not loaded, and the ones around them
+            # in the background, in case the region keeps moving
+            start, stop = self.session.rowRange(minSecs, maxSecs)
+            self.loadWindow(start, stop)
+            self.session.prefetch(start, stop)
+            start, stop = start - self.windowStart, stop - self.windowStart
+        else:
+            # Samples in the interval, from the sorted sample times
+            start = np.searchsorted(self.times, minSecs, side='left')
+            stop = np.searchsorted(self.times, maxSecs, side='right')
+        if len(self.times) > 0:
             # Update gaze and mouse plots
-            for m in self.plotElements.values():
+            for name, m in self.plotElements.items():
                 try:
-                    m.update(timeSlice)
-                except:
-                    pass
-
-
-    def loadData(self, df):
-        # Want index as seconds relative to first data point
-        df.index = pandas.to_datetime(df.index)
-        df['time'] = (df['time'] - df['time'][0]) / 1000.0
-        df = df[df['raw_x'] != 0.0]
-        
-        self.gazeData = df
-        
-        # Get speed of gaze over time (calcluate from components)
-        t = df['time']
-        dt = np.gradient(t)
-        v = (np.gradient(df['avg_x'].values, dt), np.gradient(df['avg_y'].values, dt))
-        speed = np.linalg.norm(v, axis=0) # speed in pixels/sec
+                    m.update(start, stop)
+                except (ValueError, IndexError, KeyError, TypeError):
+                    logger.exception('Could not update plot element {}'.format(name))
+
+    def updateTimings(self):
+        """ Return {plot element name: Timing of its redraws}, to find which elements are slow to draw """
+        return {name: m.timing for name, m in self.plotElements.items()}
+
+    def logUpdateTimings(self):
+        """ Log (at debug level) the redraw timings since the last log, slowest element first, e.g. after each drag or playback """
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        timings = self.updateTimings()
+        for name, timing in sorted(timings.items(), key=lambda t: -t[1].total):
+            if timing.count:
+                logger.debug('{}: {}'.format(name, timing))
+            timing.reset()
+
+
+    def loadSession(self, windowedSession):
+        """
+        Load a WindowedSession: only the overview of its speed is shown for the whole session,
+        and full data is read for the selected time region as it moves
+        """
+        self.closeSession()
+        self.session = windowedSession
+        # Derived signals are computed for the whole session when first shown, and cached on
+        # disk under the session; each window shows a slice of them
+        self.signals.setSource(windowedSession.columnArrays(), windowedSession.digest)
+        self.duration = windowedSession.duration
+        self.playback.duration = self.duration
+        self.plotSpeed(windowedSession.overviewTimes, windowedSession.overviewSpeed)
+
+        self.speedPlot.setXRange(0, self.duration)
+        self.timeRegion.setRegion((0, min(self.duration, INITIAL_WINDOW_SECS)))
+        self.updatePlot()
+        self.gazePlot.autoRange()
 
-        # Plot speed
+    def closeSession(self):
+        if self.session is not None:
+            self.session.close()
+        self.session = None
+        self.windowStart = self.windowStop = 0
+        self.signals.setSource(pandas.DataFrame())
+        self.live = None
+        if self.followAction is not None:
+            self.followAction.setChecked(False)
+
+    def loadWindow(self, start, stop):
+        """
+        Make sure rows start to stop of the windowed session are in gazeData. Only the rows and
+        the plot elements' data change: derived signals are sliced from those of the session
+        """
+        if self.windowStart <= start and stop <= self.windowStop:
+            return
+        self.gazeData, self.windowStart, self.windowStop = self.session.window(start, stop)
+        logger.debug('Loaded rows {} to {}'.format(self.windowStart, self.windowStop))
+        self.times = np.ascontiguousarray(self.gazeData['time'].values, dtype=float)
+        signals = self.shownSignals()
+        for m in self.plotElements.values():
+            m.loadData(signals)
+
+    def shownSignals(self):
+        """ The signals shown by the plot elements: those of the live tail, or of the loaded window of the session """
+        if self.live is not None:
+            return self.live
+        return self.signals.window(self.windowStart, self.windowStop, self.gazeData)
+
+    def plotSpeed(self, times, speed):
+        """ Plot speed (redrawn at the resolution of the visible range when it changes) """
+        self.speedTimes = times
+        self.speed = speed
+        self.speedPyramid = MinMaxPyramid(speed)
         self.speedPlot.clear()
-        self.speedPlot.plot(t, speed)
+        self.speedCurve = self.speedPlot.plot()
         self.speedPlot.addItem(self.timeRegion, ignoreBounds=True)
+        self.updateSpeedPlot()
 
-        # Plot gaze over entire time interval
-        maxSecs = df['time'][-1]
-        self.speedPlot.setXRange(0, maxSecs)
-        self.timeRegion.setRegion((0, maxSecs))
-        
-        # Update gaze plots
+
+    def setSignalParams(self, name, **params):
+        """ Change parameters of a derived signal and redraw; only the signals which depend on it are recomputed """
+        if self.live is not None:
+            self.live.setParams(name, **params) # also sets them in the pipeline
+        else:
+            self.signals.setParams(name, **params)
+        signals = self.shownSignals()
         for m in self.plotElements.values():
-            m.loadData(df)
+            m.loadData(signals)
         self.updatePlot()
-        self.gazePlot.autoRange()
 
+    def updateSpeedPlot(self):
+        """ Draw the visible part of the speed plot, decimated to its width """
+        if self.speedCurve is None or len(self.speedTimes) == 0:
+            return
+        minSecs, maxSecs = self.speedPlot.viewRange()[0]
+        start = max(np.searchsorted(self.speedTimes, minSecs, side='right') - 1, 0)
+        stop = min(np.searchsorted(self.speedTimes, maxSecs, side='left') + 1, len(self.speedTimes))
+        samples = self.speedPyramid.indices(start, stop, self.plotWidth(self.speedPlot))
+        self.speedCurve.setData(self.speedTimes[samples], self.speed[samples])
+
+    def plotWidth(self, plot):
+        """ Width of a plot's view in pixels: the number of samples worth drawing across it """
+        return max(int(plot.vb.width()), 100)
 
     def loadFromRecorder(self):
-        """ Load data from the gaze recorder into memory """
-        self.loadData(self.recorder.toDataFrame())
-        
+        """
+        Load the data recorded so far, which can then be followed as it is recorded (see
+        setFollowing)
+        """
+        self.closeSession()
+        self.live = LiveTail(self.recorder, self.signals)
+        self.live.update()
+        self.setLiveData()
+        self.speedPlot.setXRange(0, self.duration)
+        self.timeRegion.setRegion((0, self.duration))
+        self.updatePlot()
+        self.gazePlot.autoRange()
+
         try:
             self.info = d = self.recorder.extraData
             self.loadStim(d['stim_module'], d['stim_item'], QtCore.QPoint(d['stim_x'], d['stim_y']))
@@ -313,40 +500,102 @@ class AnalysisWindow(basewindow.BaseMainWindow):
         d = self.recorder.pathData
         if 'x' in d:
             self.loadPath(d['x'], d['y'])
-        self.path = d
+        self.path = d if 'x' in d else None # nothing drawn yet while recording
         
         self.analyze()
 
+    def setLiveData(self):
+        """ Show the signals of the live tail, all computed again """
+        self.gazeData = pandas.DataFrame()
+        self.times = self.live['time']
+        self.duration = self.times[-1] if len(self.times) else 0
+        self.playback.duration = self.duration
+        for m in self.plotElements.values():
+            m.loadData(self.live)
+        self.plotSpeed(self.times, self.live['speed'])
+
+    def setFollowing(self, following):
+        """
+        Follow the recording in progress: new frames are added to the plots as they are
+        recorded, and the time region is kept on the newest samples
+        """
+        if not following:
+            self.liveTimer.stop()
+            return
+        if self.live is None:
+            self.loadFromRecorder()
+            self.followAction.setChecked(True) # unchecked when the previous session was closed
+        self.liveTimer.start()
+
+    def updateLive(self):
+        """ Extend the signals and plots with the frames recorded since the last update """
+        changed = self.live.update()
+        if changed is None:
+            return
+        if changed == 0:
+            self.setLiveData()
+        else:
+            # Only the new samples are processed: the arrays are views of the tail's, and
+            # the pyramids are extended
+            self.times = self.live['time']
+            self.duration = self.times[-1]
+            self.playback.duration = self.duration
+            for m in self.plotElements.values():
+                m.extend(changed)
+            self.speedTimes = self.times
+            self.speed = self.live['speed']
+            self.speedPyramid.update(self.speed, changed)
+        self.speedPlot.setXRange(0, self.duration)
+        self.updateSpeedPlot()
+
+        if not (self.regionBeingDragged or self.playback.isPlaying()):
+            x1, x2 = self.timeRegion.getRegion()
+            self.timeRegion.setRegion((max(self.duration - (x2 - x1), 0), self.duration))
+        self.redraw.request()
+
     def loadFile(self, filename=None):
         if not filename:
             filename, _ = QtGui.QFileDialog.getOpenFileName(self.parent(), 'Load File', '',
                                                             'Excel Workbook (*.xlsx *.xls)')
         if filename:
-            self.loadData(pandas.read_excel(filename, 0, index_col=None))
+            self.loadSession(session.WindowedSession.fromExcel(filename))
             self.info = None
             self.path = None
-            try:
-                extraseries = pandas.read_excel(filename, 1, index_col=None)[0]
-            except IndexError:
+            workbook = pandas.ExcelFile(filename)
+            extra = session.readSheet(workbook, 1)
+            if extra is None or 0 not in extra:
                 # no other (or unexpected format of) worksheet
                 self.loadStim(None, None, None)
             else:
-                d = extraseries.to_dict()
+                d = extra[0].to_dict()
                 self.loadStim(d['stim_module'], d['stim_item'], QtCore.QPoint(d['stim_x'], d['stim_y']))
                 self.info = d
             
-            try:
-                pathseries = pandas.read_excel(filename, 2, index_col=None)
-            except IndexError:
+            d = session.readSheet(workbook, 2)
+            if d is None or 'x' not in d:
                 # no other (or unexpected format of) worksheet
                 self.loadPath(None, None)
             else:
-                d = pathseries
                 self.loadPath(d['x'], d['y'])
                 self.path = d
         
         self.analyze()
 
+    def exportSignals(self, filename=None):
+        """
+        Save the recorded columns and the derived signals of the whole session (or of the
+        recording followed) as CSV. Derived signals not computed yet are computed now
+        """
+        if len(self.times) == 0:
+            logger.info('Nothing to export')
+            return
+        if not filename:
+            filename, _ = QtGui.QFileDialog.getSaveFileName(self.parent(), 'Export signals', '', 'CSV (*.csv)')
+        if filename:
+            signals = self.live if self.live is not None else self.signals
+            signals.toDataFrame(sorted(self.signals.nodes)).to_csv(filename, index=False)
+            logger.info('Exported signals to {}'.format(filename))
+
     def loadStim(self, modname, funcname, pos):
         """
         Load a stimulus and draw it on the plot.
@@ -377,35 +626,57 @@ class AnalysisWindow(basewindow.BaseMainWindow):
     def analyze(self):
         """
         Perform error analysis after loading the data.
-        Currently: if there is a stimulus, check the intersection
+        Currently: if there is a stimulus, check the overlap and boundary distances
         """
-        import shapely.geometry      
+        if self.path is None or self.stimItem is None:
+            return
+        
+        userPath = PathData.fromPoints(np.column_stack([self.path['x'], self.path['y']]))
+        stimPath = gazecontour.images.stimulusContour(self.stimItem)
         
-        userPoints = zip(self.path['x'], self.path['y'])
-        userPolygon=shapely.geometry.Polygon(userPoints)
-        stimPoints = bezier.BezierPath.interpolateToPoints(self.stimItem.path())
-        stimPolygon=shapely.geometry.Polygon(bezier.geometry.xyFromPoints(stimPoints, self.stimItem.pos()))
+        # Exact area, length and centroid of the contours
+        userArea, stimArea = userPath.area(), stimPath.area()
+        print('Areas: Path={}, Stim={}'.format(userArea, stimArea))
+        print('Lengths: Path={}, Stim={}'.format(userPath.length(), stimPath.length()))
+        print('Centroids: Path={}, Stim={}'.format(userPath.centroid(), stimPath.centroid()))
         
-        print('Areas: Path={}, Stim={}'.format(userPolygon.area, stimPolygon.area))
-        print(stimPolygon, '\n', userPolygon)
-        intersection = userPolygon.intersection(stimPolygon)
-        print('Intersect = {}'.format(intersection.area))
+        # Overlap of the filled contours, on a raster, and distances between the boundaries
+        cellSize = self.overlapCellSize
+        key = digest(userPath.points, stimPath.points, stimPath.types)
+        params = {'cellSize': cellSize}
+        cached = self.resultCache.get(key, 'analyze', ANALYSIS_VERSION, params)
+        if cached is None:
+            overlap = metrics.OverlapScorer(stimPath, cellSize).score(userPath)
+            distances = metrics.DistanceScorer(stimPath).score(userPath)
+            self.resultCache.put(key, 'analyze', ANALYSIS_VERSION, tuple(overlap) + tuple(distances), params)
+        else:
+            cached = [float(v) for v in cached]
+            overlap, distances = metrics.Overlap(*cached[:6]), metrics.Distances(*cached[6:])
+        print('Intersect = {}'.format(overlap.intersection))
+        print('DSC = {}, IoU = {}'.format(overlap.dice, overlap.iou))
         
-        DSC = 2*intersection.area/(userPolygon.area+ stimPolygon.area)
-        print('DSC = {}'.format(DSC))
+        print('Hausdorff = {}, mean = {}, median = {}, 95th percentile = {}'.format(*distances))
         
-        # Plot
-        from descartes import PolygonPatch
+        # Plot the masks: path in blue, stimulus in red, intersection in magenta. They are cached
+        # with the results, so reopening a session does not rasterize the contours again
+        masks = self.resultCache.get(key, 'analyzeMasks', ANALYSIS_VERSION, params)
+        if masks is None:
+            userPoints, stimPoints = metrics.contourPoints(userPath, cellSize), metrics.contourPoints(stimPath, cellSize)
+            origin, shape = metrics.gridFor([userPoints, stimPoints], cellSize)
+            userMask = metrics.rasterize(userPoints, origin, cellSize, shape)
+            stimMask = metrics.rasterize(stimPoints, origin, cellSize, shape)
+            self.resultCache.put(key, 'analyzeMasks', ANALYSIS_VERSION, (userMask, stimMask, np.asarray(origin)), params)
+        else:
+            userMask, stimMask, origin = masks[0].astype(bool), masks[1].astype(bool), masks[2]
+        shape = userMask.shape
+        image = np.ones(shape + (3,))
+        image[userMask] = (0.5, 0.5, 1)
+        image[stimMask] = (1, 0.5, 0.5)
+        image[userMask & stimMask] = (0.75, 0.25, 0.75)
         plt.ion()
         f, ax = plt.subplots()
-        A = PolygonPatch(userPolygon, fc='b', alpha=0.5)
-        B = PolygonPatch(stimPolygon, fc='r', alpha=0.5)
-        C = PolygonPatch(intersection, fc='m', ec='m', alpha=0.5)
-        ax.add_patch(A)
-        ax.add_patch(B)
-        ax.add_patch(C)
-        ax.invert_yaxis()
-        ax.autoscale_view()
+        ax.imshow(image, interpolation='nearest',
+                  extent=(origin[0], origin[0] + shape[1]*cellSize, origin[1] + shape[0]*cellSize, origin[1]))
                 
     def paintEvent(self, ev):
         p = QtGui.QPainter(self)
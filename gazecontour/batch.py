@@ -0,0 +1,231 @@
+"""
+Analyze recorded sessions without the GUI, e.g. all the recordings of a study:
+
+    python -m gazecontour.batch data/ -o results.csv
+
+Recordings are analyzed in parallel, one per process, and each result is added to the results
+table as soon as it is ready. Running the same command again skips the recordings already in
+the table with the same options (unless they changed since, or their analysis failed), so an
+interrupted run can be resumed.
+"""
+import os
+import sys
+import glob
+import argparse
+import importlib
+import collections
+import concurrent.futures
+
+import numpy as np
+import pandas
+
+from gazecontour import session, metrics, distancefield
+from gazecontour.realtime import GazeProcessor
+from vectorbrush.pathdata import PathData
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Columns of the results table
+COLUMNS = ('file', 'size', 'mtime', 'cellSize', 'fixationWindow', 'fixationThreshold',
+           'samples', 'duration', 'stimulus',
+           'gazeError', 'fixationError',
+           'pathArea', 'stimArea', 'pathLength', 'stimLength',
+           'intersection', 'union', 'dice', 'iou',
+           'hausdorff', 'meanDistance', 'medianDistance', 'p95Distance',
+           'error')
+
+# File types of recordings, when a directory is given
+PATTERNS = ('*.xlsx', '*.xls')
+
+# Parameters of the analysis, and their defaults
+Options = collections.namedtuple('Options', 'cellSize fixationWindow fixationThreshold')
+DEFAULT_OPTIONS = Options(cellSize=0.5, fixationWindow=15, fixationThreshold=100)
+
+# A saved recording: gaze data (DataFrame, see session.prepare, or None), stimulus information
+# (dict, or None), drawn path (DataFrame of x and y, or None), raw strokes ({stroke number: Nx2
+# array}) and warp edits not undone ([(stroke number, Nx6 array of steps)] in order, see Recorder.saveWarp)
+Recording = collections.namedtuple('Recording', 'gaze stim path strokes warps')
+
+
+def readRecording(filename, gaze=True):
+    """ Read a recording saved by Recorder.saveToFile; without gaze, the gaze data is not read """
+    workbook = pandas.ExcelFile(filename)
+    gaze = session.prepare(session.readSheet(workbook, 0)) if gaze else None
+    stim = session.readSheet(workbook, 1)
+    stim = stim[0].to_dict() if stim is not None and 0 in stim else None
+    path = session.readSheet(workbook, 2)
+    if path is not None and ('x' not in path or len(path) == 0):
+        path = None
+
+    # Older recordings have no strokes and warps
+    strokes = collections.OrderedDict()
+    warps = []
+    df = session.readSheet(workbook, 3)
+    if df is not None:
+        for stroke, points in df.groupby('stroke', sort=False):
+            strokes[int(stroke)] = points[['x', 'y']].values.astype(float)
+    df = session.readSheet(workbook, 4)
+    if df is not None:
+        for edit, steps in df.groupby('edit', sort=True):
+            warps.append((int(steps['stroke'].values[0]),
+                          steps[['x', 'y', 'dx', 'dy', 'radius', 'strength']].values.astype(float)))
+    return Recording(gaze, stim, path, strokes, warps)
+
+
+def stimulusFunction(stim):
+    """ Return the function which draws the stimulus of a recording """
+    return getattr(importlib.import_module(stim['stim_module']), stim['stim_item'])
+
+
+def stimulusPath(stim):
+    """ Return the outline of the stimulus of a recording, in screen coordinates, as PathData """
+    from gazecontour import images
+    outline = images.stimulusOutline(stimulusFunction(stim))
+    return PathData(outline.points + (stim['stim_x'], stim['stim_y']), outline.types)
+
+
+def analyzeRecording(recording, options=DEFAULT_OPTIONS):
+    """
+    Score a recording against its stimulus: the distances of gaze and of fixations to the
+    stimulus outline, and the overlap and distances between the drawn path and the outline.
+    Return a dict of the results (see COLUMNS); those which don't apply are missing.
+    """
+    gaze = recording.gaze
+    times = gaze['time'].values
+    result = {'samples': len(gaze), 'duration': float(times[-1]) if len(times) else 0.0}
+    if recording.stim is None:
+        return result
+
+    stimFunc = stimulusFunction(recording.stim)
+    stimPos = np.array([recording.stim['stim_x'], recording.stim['stim_y']], dtype=float)
+    result['stimulus'] = '{}.{}'.format(stimFunc.__module__, stimFunc.__name__)
+
+    # Unsigned distances of gaze and of fixations to the outline, from its distance field
+    field = distancefield.forStimulus(stimFunc)
+    if len(gaze):
+        avg = np.column_stack([gaze['avg_x'].values, gaze['avg_y'].values])
+        result['gazeError'] = float(np.nanmean(np.abs(field.sample(avg - stimPos))))
+        processor = GazeProcessor(options.fixationWindow, options.fixationThreshold)
+        fixations = np.column_stack(processor.process_arrays(gaze['raw_x'].values, gaze['raw_y'].values))
+        result['fixationError'] = float(np.nanmean(np.abs(field.sample(fixations - stimPos))))
+
+    if recording.path is None:
+        return result
+    stimPath = stimulusPath(recording.stim)
+    userPath = PathData.fromPoints(np.column_stack([recording.path['x'].values, recording.path['y'].values]))
+    overlap = metrics.OverlapScorer(stimPath, options.cellSize).score(userPath)
+    distances = metrics.DistanceScorer(stimPath).score(userPath)
+    result.update(pathArea=userPath.area(), stimArea=stimPath.area(),
+                  pathLength=userPath.length(), stimLength=stimPath.length(),
+                  intersection=overlap.intersection, union=overlap.union, dice=overlap.dice, iou=overlap.iou,
+                  hausdorff=distances.hausdorff, meanDistance=distances.mean,
+                  medianDistance=distances.median, p95Distance=distances.p95)
+    return result
+
+
+def analyzeFile(filename, options=DEFAULT_OPTIONS):
+    """ Read and analyze a recording; return its row of the results table, with the error if it failed """
+    stat = os.stat(filename)
+    row = {'file': filename, 'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+    row.update(options._asdict())
+    try:
+        row.update(analyzeRecording(readRecording(filename), options))
+    except Exception as e:
+        logger.exception('Could not analyze {}'.format(filename))
+        row['error'] = '{}: {}'.format(type(e).__name__, e)
+    return row
+
+
+def findRecordings(inputs):
+    """ Return the recordings given as files, directories or glob patterns, sorted, as absolute paths """
+    filenames = set()
+    for i in inputs:
+        if os.path.isdir(i):
+            for pattern in PATTERNS:
+                filenames.update(glob.glob(os.path.join(i, '**', pattern), recursive=True))
+        else:
+            filenames.update(glob.glob(i) if glob.has_magic(i) else [i])
+    return sorted(os.path.abspath(f) for f in filenames)
+
+
+def readResults(output, keys=('file',)):
+    """ Return the results table in output, with the latest row of each recording (or other keys), or None """
+    try:
+        table = pandas.read_csv(output)
+    except (IOError, OSError, ValueError):
+        return None
+    reverse = table.iloc[::-1]
+    return reverse[~reverse.duplicated(list(keys))].iloc[::-1]
+
+
+def done(table, options):
+    """ Return {file: (size, mtime)} of the recordings analyzed with options and without error in a results table """
+    if table is None:
+        return {}
+    ok = table['error'].isnull()
+    for name, value in options._asdict().items():
+        ok &= table[name] == value
+    ok = table[ok]
+    return {f: (int(size), int(mtime)) for f, size, mtime in zip(ok['file'], ok['size'], ok['mtime'])}
+
+
+def run(filenames, output, options=DEFAULT_OPTIONS, jobs=None, resume=True):
+    """
+    Analyze recordings in a pool of `jobs` processes (default: one per CPU), adding each row to
+    the table in output as it is ready. With resume, recordings already in the table with the
+    same options, and not changed since, are skipped. Return the number of recordings analyzed.
+    """
+    previous = done(readResults(output), options) if resume else {}
+    todo = []
+    for f in filenames:
+        stat = os.stat(f)
+        if previous.get(f) != (stat.st_size, int(stat.st_mtime)):
+            todo.append(f)
+    logger.info('{} recordings to analyze, {} done before'.format(len(todo), len(filenames) - len(todo)))
+    if not resume and os.path.exists(output):
+        os.remove(output)
+
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        futures = [executor.submit(analyzeFile, f, options) for f in todo]
+        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+            row = future.result()
+            header = not os.path.exists(output)
+            pandas.DataFrame([row], columns=COLUMNS).to_csv(output, mode='a', header=header, index=False)
+            logger.info('[{}/{}] {}{}'.format(i + 1, len(todo), row['file'], ' failed' if 'error' in row else ''))
+
+    # Keep only the latest row of each recording
+    table = readResults(output)
+    if table is not None:
+        temp = output + '.tmp'
+        table.to_csv(temp, index=False)
+        os.replace(temp, output)
+    return len(todo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyze recorded sessions without the GUI')
+    parser.add_argument('inputs', nargs='+', help='recordings (.xlsx), directories of recordings, or glob patterns')
+    parser.add_argument('-o', '--output', default='results.csv', help='results table (.csv), added to if it exists')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of processes (default: one per CPU)')
+    parser.add_argument('--restart', action='store_true', help='analyze all recordings again, not only new ones')
+    parser.add_argument('--cell-size', type=float, default=DEFAULT_OPTIONS.cellSize,
+                        help='size in px of the cells of the masks used to score overlap')
+    parser.add_argument('--fixation-window', type=int, default=DEFAULT_OPTIONS.fixationWindow,
+                        help='number of samples averaged into a fixation')
+    parser.add_argument('--fixation-threshold', type=float, default=DEFAULT_OPTIONS.fixationThreshold,
+                        help='distance in px from a fixation which starts a saccade')
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='[%(levelname)-8s] %(name)15s: %(message)s', level=logging.INFO)
+
+    filenames = findRecordings(args.inputs)
+    if not filenames:
+        logger.error('No recordings found')
+        return 1
+    options = Options(args.cell_size, args.fixation_window, args.fixation_threshold)
+    run(filenames, args.output, options, args.jobs, resume=not args.restart)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import numpy as np
+
+
+class MinMaxPyramid(object):
+    """
+    Multi-resolution summary of a series, for drawing long recordings at screen resolution.
+
+    Level k divides the samples into buckets of 2**k and stores the indices of the smallest and
+    largest sample in each bucket. Drawing only those samples at the level where the visible
+    buckets about match the pixel width keeps every peak, at a cost which depends on the width
+    and not on the number of samples. The levels take about twice the memory of the indices
+    of the series, and are built once.
+    """
+    def __init__(self, values):
+        self.size = 0
+        self._levels = [] # [minima buffer, maxima buffer, number of buckets] of each level
+        self.update(values)
+
+    @property
+    def levels(self):
+        """ levels[k-1] = (indices of minima, indices of maxima) in buckets of 2**k """
+        return [(lo[:n], hi[:n]) for lo, hi, n in self._levels]
+
+    def update(self, values, start=None):
+        """
+        Take in the samples appended to values since the pyramid was built or last updated, and
+        changes to values from index start on. Only the buckets holding those samples are
+        recomputed, so following a growing series costs about the number of new samples.
+        """
+        values = np.asarray(values, dtype=float)
+        size = len(values)
+        first = self.size if start is None else min(start, self.size)
+        count = size
+        k = 0
+        while count > 1:
+            # Buckets of level k+1 from the one holding the first changed sample, each from
+            # two buckets of level k (or the same one twice, for an odd last bucket)
+            first >>= 1
+            a = np.arange(2 * first, count, 2)
+            b = np.minimum(a + 1, count - 1)
+            if k == 0:
+                lo, hi = self._pick(values, a, b, np.less), self._pick(values, a, b, np.greater)
+            else:
+                prevLo, prevHi, _ = self._levels[k - 1]
+                lo = self._pick(values, prevLo[a], prevLo[b], np.less)
+                hi = self._pick(values, prevHi[a], prevHi[b], np.greater)
+            count = (count + 1) // 2
+            self._store(k, first, count, lo, hi)
+            k += 1
+        self.size = size
+
+    def _store(self, k, first, count, lo, hi):
+        if k == len(self._levels):
+            self._levels.append([np.empty(count, dtype=int), np.empty(count, dtype=int), 0])
+        level = self._levels[k]
+        if count > len(level[0]):
+            # Grow by doubling, so appending costs the same on average however long the series
+            for i in (0, 1):
+                grown = np.empty(max(count, 2 * len(level[i])), dtype=int)
+                grown[:level[2]] = level[i][:level[2]]
+                level[i] = grown
+        level[0][first:count] = lo
+        level[1][first:count] = hi
+        level[2] = count
+
+    @staticmethod
+    def _pick(values, a, b, better):
+        # Prefer b where it is better than a, or where a is missing (NaN)
+        return np.where(better(values[b], values[a]) | np.isnan(values[a]), b, a)
+
+    def indices(self, start, stop, maxPoints):
+        """
+        Return the samples to draw from start to stop so that about maxPoints buckets are shown:
+        a slice if all samples fit, otherwise a sorted array of sample indices with the first,
+        last, smallest and largest sample of each bucket.
+        """
+        count = stop - start
+        if count <= maxPoints or not self.levels:
+            return slice(start, stop)
+        k = min(int(np.ceil(np.log2(count / maxPoints))), len(self.levels))
+        lo, hi = self.levels[k - 1]
+        first, last = start >> k, (stop - 1) >> k
+        lo, hi = lo[first:last + 1], hi[first:last + 1]
+        chosen = np.concatenate([[start, stop - 1], lo, hi])
+        return np.unique(chosen[(chosen >= start) & (chosen < stop)])
+
+
+def decimate(pyramids, start, stop, maxPoints):
+    """
+    Return the samples to draw from start to stop for several series of the same length (e.g.
+    x and y of a gaze trace), keeping the extremes of each: a slice or an array of indices
+    """
+    chosen = [p.indices(start, stop, maxPoints) for p in pyramids]
+    if any(isinstance(c, slice) for c in chosen):
+        return slice(start, stop)
+    return np.unique(np.concatenate(chosen))
+
+
+class SlidingWindow(object):
+    """
+    The samples to draw of a window moving forward through several series of the same length
+    (e.g. x, y and time during playback), kept in preallocated buffers.
+
+    Moving the window appends the samples which entered it and drops those which left, so the
+    cost of each step depends on the samples passed, not on the length of the window. As in
+    MinMaxPyramid.indices, a window longer than maxPoints keeps the first, smallest and largest
+    sample of each bucket at a level chosen when the window is created; only whole buckets are
+    appended, so the newest (part of a) bucket, less than a pixel wide, is drawn once complete.
+    """
+    def __init__(self, pyramids, series, start, stop, maxPoints):
+        self.pyramids = pyramids
+        self.series = series
+        levels = len(pyramids[0].levels)
+        count = max(stop - start, 1)
+        self.level = 0 if count <= maxPoints else min(int(np.ceil(np.log2(count / maxPoints))), levels)
+        self.length = count
+        capacity = 4 * ((count >> self.level) + 2) * (1 if self.level == 0 else 1 + 2 * len(pyramids))
+        self._indices = np.empty(capacity, dtype=int)
+        self._buffers = [np.empty(capacity, dtype=s.dtype) for s in series]
+        self.head = self.tail = 0
+        self.start = start
+        self.stop = (start >> self.level) << self.level
+
+    def follows(self, start, stop):
+        """ Whether the window can move to start..stop: forward, keeping about its length """
+        return start >= self.start and stop >= self.stop and self.length // 2 <= stop - start <= 2 * self.length
+
+    def advance(self, start, stop):
+        """ Move the window to samples start to stop; return views of the buffers of each series """
+        end = stop if self.level == 0 else (stop >> self.level) << self.level
+        if end > self.stop:
+            self._append(self._pick(self.stop, end))
+            self.stop = end
+        self.head += int(np.searchsorted(self._indices[self.head:self.tail], start))
+        self.start = start
+        return [b[self.head:self.tail] for b in self._buffers]
+
+    def _pick(self, start, stop):
+        """ Samples to draw from start to stop, which are bucket boundaries """
+        if self.level == 0:
+            return np.arange(start, stop)
+        first, last = start >> self.level, stop >> self.level
+        chosen = [np.arange(first, last) << self.level]
+        for p in self.pyramids:
+            lo, hi = p.levels[self.level - 1]
+            chosen += [lo[first:last], hi[first:last]]
+        return np.unique(np.concatenate(chosen))
+
+    def _append(self, indices):
+        n = len(indices)
+        live = self.tail - self.head
+        if self.tail + n > len(self._indices):
+            # Move the samples in the window to the front, growing the buffers if they are full
+            capacity = len(self._indices) if live + n <= len(self._indices) // 2 else 2 * (live + n)
+            buffers = [self._indices] + self._buffers
+            for i, b in enumerate(buffers):
+                moved = b[self.head:self.tail].copy()
+                if capacity != len(b):
+                    b = buffers[i] = np.empty(capacity, dtype=b.dtype)
+                b[:live] = moved
+            self._indices, self._buffers = buffers[0], buffers[1:]
+            self.head, self.tail = 0, live
+        self._indices[self.tail:self.tail + n] = indices
+        for b, s in zip(self._buffers, self.series):
+            b[self.tail:self.tail + n] = s[indices]
+        self.tail += n
@@ -0,0 +1,144 @@
+import os
+import glob
+import zipfile
+import hashlib
+import tempfile
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Where derived results are kept between sessions
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.gazecontour', 'results')
+
+# Errors of np.load for a cache file which is missing, truncated or from an older format
+LOAD_ERRORS = (IOError, OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile)
+
+
+def digest(*parts):
+    """
+    Content hash of arrays, DataFrames (or dicts of columns) and other values (converted with
+    repr), e.g. to identify a recording session
+    """
+    h = hashlib.sha1()
+    for part in parts:
+        if hasattr(part, 'keys'):
+            # DataFrame or mapping of columns: hash each column by name and contents
+            for column in sorted(part.keys(), key=str):
+                values = part[column]
+                h.update(repr(column).encode())
+                h.update(_bytes(getattr(values, 'values', values)))
+        else:
+            h.update(_bytes(part))
+    return h.hexdigest()
+
+
+def saveArrays(filename, **arrays):
+    """
+    Save arrays to a .npz file, replacing any existing file in one step. Each call writes its
+    own temporary file first, so processes saving the same file at once don't mix their writes.
+    """
+    fd, temp = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(filename))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temp, filename)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+
+
+def _bytes(value):
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        return repr((value.dtype.str, value.shape)).encode() + np.ascontiguousarray(value).tobytes()
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    return repr(value).encode()
+
+
+class DiskCache(object):
+    """
+    Persistent cache of derived results (arrays, or tuples of arrays and numbers), stored as .npz
+    files in directory.
+
+    Each result is identified by the content hash of its input data, the name and version of the
+    algorithm and its parameters. Storing a result under a new version of an algorithm deletes
+    all results of its earlier versions. Reading a result marks it as recently used (by its file
+    time), and when the files take more than maxBytes, the least recently used are deleted.
+    """
+    def __init__(self, directory=CACHE_DIR, maxBytes=256*1024*1024):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self._checkedVersions = set()
+
+    def filename(self, dataDigest, name, version, params=None):
+        paramsDigest = digest(sorted((params or {}).items()))[:16]
+        return os.path.join(self.directory, '{}-v{}-{}-{}.npz'.format(name, version, dataDigest[:24], paramsDigest))
+
+    def get(self, dataDigest, name, version, params=None):
+        """ Return the cached result, or None """
+        filename = self.filename(dataDigest, name, version, params)
+        try:
+            with np.load(filename) as f:
+                value = self._unpack(f)
+            os.utime(filename, None)
+        except LOAD_ERRORS:
+            return None
+        return value
+
+    def put(self, dataDigest, name, version, value, params=None):
+        filename = self.filename(dataDigest, name, version, params)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self._removeOldVersions(name, version)
+            saveArrays(filename, **self._pack(value))
+            self._evict()
+        except OSError as e:
+            logger.warning('Could not cache {}: {}'.format(name, e))
+
+    def clear(self):
+        for f in glob.glob(os.path.join(self.directory, '*.npz')):
+            os.remove(f)
+
+    @staticmethod
+    def _pack(value):
+        if isinstance(value, tuple):
+            arrays = {'item_{}'.format(i): np.asarray(v) for i, v in enumerate(value)}
+            arrays['length'] = np.array(len(value))
+            return arrays
+        return {'value': np.asarray(value)}
+
+    @staticmethod
+    def _unpack(f):
+        if 'length' in f.files:
+            return tuple(f['item_{}'.format(i)] for i in range(int(f['length'])))
+        return f['value']
+
+    def _removeOldVersions(self, name, version):
+        if (name, version) in self._checkedVersions:
+            return
+        self._checkedVersions.add((name, version))
+        current = '{}-v{}-'.format(name, version)
+        for f in glob.glob(os.path.join(self.directory, glob.escape(name) + '-v*.npz')):
+            if not os.path.basename(f).startswith(current):
+                logger.debug('Removing result of an old version: {}'.format(f))
+                os.remove(f)
+
+    def _evict(self):
+        files = []
+        for f in glob.glob(os.path.join(self.directory, '*.npz')):
+            try:
+                stat = os.stat(f)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, f))
+        total = sum(size for _, size, _ in files)
+        for _, size, f in sorted(files):
+            if total <= self.maxBytes:
+                break
+            os.remove(f)
+            total -= size
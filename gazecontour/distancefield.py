@@ -0,0 +1,109 @@
+import os
+import hashlib
+
+import numpy as np
+import scipy.ndimage
+
+from gazecontour import metrics, diskcache
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Where distance fields of stimuli are kept between sessions
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.gazecontour', 'distancefields')
+
+
+class DistanceField(object):
+    """
+    Signed distance to a contour, sampled at the centers of a grid of square cells: negative
+    inside the contour, positive outside. Distances at arbitrary points are interpolated
+    bilinearly, which costs the same however complex the contour is.
+    """
+    def __init__(self, values, origin, cellSize):
+        self.values = np.asarray(values, dtype=np.float32)
+        self.origin = np.asarray(origin, dtype=float)
+        self.cellSize = cellSize
+
+    @classmethod
+    def fromContour(cls, contour, cellSize=2.0, margin=200):
+        """
+        Compute the field of a contour (PathData or Nx2 array), on a grid reaching margin beyond it
+        """
+        polygon = metrics.contourPoints(contour, cellSize)
+        origin, shape = metrics.gridFor([polygon.min(axis=0) - margin, polygon.max(axis=0) + margin], cellSize)
+        rows, cols = shape
+
+        # Mark the cells the contour passes through with one of its points, then find the nearest
+        # marked cell to each cell with a Euclidean distance transform, and measure the distance
+        # to that cell's point. This is within about a cell of the true distance.
+        samples = metrics.contourSamples(contour, cellSize / 4)
+        cells = np.floor((samples - origin) / cellSize).astype(int)
+        owner = np.full(shape, -1)
+        owner[cells[:, 1], cells[:, 0]] = np.arange(len(samples))
+        _, (nearestRow, nearestCol) = scipy.ndimage.distance_transform_edt(owner < 0, return_indices=True)
+        nearest = samples[owner[nearestRow, nearestCol]]
+        y, x = np.mgrid[:rows, :cols]
+        distances = np.hypot(origin[0] + (x + 0.5) * cellSize - nearest[..., 0],
+                             origin[1] + (y + 0.5) * cellSize - nearest[..., 1])
+
+        inside = metrics.rasterize(polygon, origin, cellSize, shape)
+        return cls(np.where(inside, -distances, distances), origin, cellSize)
+
+    def sample(self, points):
+        """
+        Return the signed distances at an Nx2 array of points. Beyond the grid, the distance from
+        the point to the edge of the grid is added to the value there.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        rows, cols = self.values.shape
+        u = (points - self.origin) / self.cellSize - 0.5
+        clamped = np.clip(u, 0, [cols - 1, rows - 1])
+        i = np.minimum(clamped.astype(int), [cols - 2, rows - 2])
+        f = clamped - i
+        v = self.values
+        x0, y0, fx, fy = i[:, 0], i[:, 1], f[:, 0], f[:, 1]
+        top = v[y0, x0] * (1 - fx) + v[y0, x0 + 1] * fx
+        bottom = v[y0 + 1, x0] * (1 - fx) + v[y0 + 1, x0 + 1] * fx
+        outside = np.hypot(*(u - clamped).T) * self.cellSize
+        return top * (1 - fy) + bottom * fy + outside
+
+    def save(self, filename):
+        """ Save to a .npz file, replacing any existing file in one step """
+        diskcache.saveArrays(filename, values=self.values, origin=self.origin, cellSize=self.cellSize)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            return cls(f['values'], f['origin'], float(f['cellSize']))
+
+
+_fields = {}
+
+def forStimulus(stimFunc, cellSize=2.0, cacheDir=CACHE_DIR):
+    """
+    Return the DistanceField of a stimulus function from gazecontour.images, in the coordinates
+    of the stimulus item (subtract the item's position from scene coordinates).
+    Fields are computed when first needed and cached in memory and in cacheDir. The cache file
+    name includes a hash of the contour, so changing a stimulus invalidates its field.
+    """
+    from gazecontour import images
+    contour = images.stimulusOutline(stimFunc)
+    digest = hashlib.sha1(contour.points.tobytes() + contour.types.tobytes()).hexdigest()[:16]
+    name = '{}.{}-{}-{}.npz'.format(stimFunc.__module__, stimFunc.__name__, cellSize, digest)
+
+    field = _fields.get(name)
+    if field is not None:
+        return field
+    filename = os.path.join(cacheDir, name)
+    try:
+        field = DistanceField.load(filename)
+    except diskcache.LOAD_ERRORS:
+        logger.debug('Computing distance field for {}'.format(stimFunc.__name__))
+        field = DistanceField.fromContour(contour, cellSize)
+        try:
+            os.makedirs(cacheDir, exist_ok=True)
+            field.save(filename)
+        except OSError as e:
+            logger.warning('Could not cache distance field: {}'.format(e))
+    _fields[name] = field
+    return field
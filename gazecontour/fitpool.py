@@ -0,0 +1,68 @@
+import concurrent.futures
+
+from PySide import QtCore
+
+from vectorbrush import fitting
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class FitPool(QtCore.QObject):
+    """
+    Runs contour fits (vectorbrush.fitting.fitContour) in a pool of worker processes, so that
+    long strokes don't freeze the GUI or the tracker connection.
+
+    Each job belongs to a key (e.g. the contour item being fitted). Submitting a new job for a key
+    cancels the previous one, and the result of a superseded job is never reported.
+    Results are delivered in the GUI thread through the fitFinished and fitFailed signals.
+    """
+    fitFinished = QtCore.Signal(object, object) # key, Sx4x2 array of Bezier curves
+    fitFailed = QtCore.Signal(object, object) # key, exception
+    _jobDone = QtCore.Signal(object, object) # key, future (emitted from a pool thread)
+
+    def __init__(self, maxWorkers=None, parent=None):
+        super().__init__(parent)
+        self.maxWorkers = maxWorkers
+        self._executor = None
+        self._jobs = {}
+        self._jobDone.connect(self._handleJobDone, QtCore.Qt.QueuedConnection)
+
+    def submit(self, key, points, simpleness, smoothness, method=fitting.BSPLINE):
+        """ Start fitting an Nx2 array of points, superseding any pending job for the same key """
+        self.cancel(key)
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(self.maxWorkers)
+
+        future = self._executor.submit(fitting.fitContour, points, simpleness, smoothness, method)
+        self._jobs[key] = future
+        future.add_done_callback(lambda f: self._jobDone.emit(key, f))
+
+    def cancel(self, key):
+        """ Forget the pending job for key, and stop it if it has not started yet """
+        future = self._jobs.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def isPending(self, key=None):
+        """ Whether a job is pending for key (or for any key, if None) """
+        return bool(self._jobs) if key is None else key in self._jobs
+
+    def shutdown(self):
+        for key in list(self._jobs):
+            self.cancel(key)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _handleJobDone(self, key, future):
+        if self._jobs.get(key) is not future:
+            return # superseded or cancelled
+        del self._jobs[key]
+
+        error = future.exception()
+        if error is not None:
+            logger.warning('Contour fit failed: {}'.format(error))
+            self.fitFailed.emit(key, error)
+        else:
+            self.fitFinished.emit(key, future.result())
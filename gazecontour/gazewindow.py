@@ -1,17 +1,24 @@
 import sys
 import math
+import collections
 
 from PySide import QtCore, QtGui
 from PySide.QtCore import Qt, QPoint, QPointF
 from PySide.QtNetwork import QAbstractSocket
+import numpy as np
 
 from gazecontour import basewindow
 from gazecontour.recorder import Recorder
 from gazecontour.eyetribe import EyeTribe
+from gazecontour.history import EditHistory
+from gazecontour.fitpool import FitPool
+from gazecontour import distancefield
 import gazecontour.realtime
 import gazecontour.images
 
-from vectorbrush import bezier
+from vectorbrush import bezier, fitting
+from vectorbrush.pathdata import PathData
+from vectorbrush.fitcache import FitCache
 
 # Set up logging
 import logging
@@ -39,9 +46,14 @@ class GazeWindow(basewindow.BaseMainWindow):
         # Status bar
         self.statusLabelTracker = QtGui.QLabel()
         self.statusLabelRec = QtGui.QLabel()
+        self.statusLabelError = QtGui.QLabel()
+        self.statusBar().addPermanentWidget(self.statusLabelError)
         self.statusBar().addPermanentWidget(self.statusLabelTracker)
         self.statusBar().addPermanentWidget(self.statusLabelRec)
 
+        # Distances of recent gaze samples from the stimulus outline
+        self.gazeErrors = collections.deque(maxlen=60)
+
         # Initialize data recorder
         self.recorder = Recorder(statusLabel=self.statusLabelRec)
             
@@ -51,6 +63,11 @@ class GazeWindow(basewindow.BaseMainWindow):
         self.gazeWidget.lower()
         self.setCentralWidget(gazeWidget)
         self._desktopWidget = QtGui.QDesktopWidget()
+        # Keep the raw strokes and warp edits, to re-fit them offline (see gazecontour.refit)
+        gazeWidget.strokeDrawn.connect(self.saveStroke)
+        gazeWidget.strokeDiscarded.connect(self.recorder.discardStroke)
+        gazeWidget.strokeWarped.connect(self.saveWarp)
+        gazeWidget.warpUndone.connect(self.recorder.setWarpUndone)
 
         # Stimulus (the image to trace)
         self.setStimFunc(stimFunc)
@@ -70,6 +87,10 @@ class GazeWindow(basewindow.BaseMainWindow):
         editAction = QtGui.QAction(editIcon, "Edit", self)
         editAction.setCheckable(True)
         editAction.setShortcut(QtGui.QKeySequence(Qt.Key_Space))
+        undoAction = QtGui.QAction(self.style().standardIcon(QtGui.QStyle.SP_ArrowBack), "Undo", self)
+        undoAction.setShortcut(QtGui.QKeySequence.Undo)
+        redoAction = QtGui.QAction(self.style().standardIcon(QtGui.QStyle.SP_ArrowForward), "Redo", self)
+        redoAction.setShortcut(QtGui.QKeySequence.Redo)
         
         # Connect actions
         recAction.toggled.connect(self.recorder.setRecording)
@@ -77,7 +98,7 @@ class GazeWindow(basewindow.BaseMainWindow):
             if not v:
                 # Save path when stopping recording (for now just one)
                 try:
-                    points = self.gazeWidget.bezierPaths[0].bezierPath().interpolateToPoints()
+                    points = [QPointF(x, y) for x, y in self.gazeWidget.bezierPaths[0].pathData().flatten()]
                     screenpos = self._desktopWidget.screenGeometry(self._desktopWidget.screenNumber(self)).topLeft()
                     w = self.gazeWidget
                     points = [w.mapToGlobal(w.mapFromScene(p)) - screenpos for p in points]
@@ -93,6 +114,8 @@ class GazeWindow(basewindow.BaseMainWindow):
         clearAction.triggered.connect(lambda: gazeWidget.clear())
 
         editAction.toggled.connect(gazeWidget.setEditMode)
+        undoAction.triggered.connect(gazeWidget.undo)
+        redoAction.triggered.connect(gazeWidget.redo)
         
         controlCursorAction = QtGui.QAction('Control cursor', self)
         controlCursorAction.setCheckable(True)
@@ -105,15 +128,17 @@ class GazeWindow(basewindow.BaseMainWindow):
         simplifyAction.triggered.connect(gazeWidget.simplifyAllPaths)
 
         # Toolbar
-        self.toolbar.addActions([recAction, clearAction, saveAction, editAction])
+        self.toolbar.addActions([recAction, clearAction, saveAction, editAction, undoAction, redoAction])
         drawGazeCheckbox = QtGui.QCheckBox('Show Gaze', self)
         showRawCheckbox = QtGui.QCheckBox('Show Raw', self)
         editHandlesCheckbox = QtGui.QCheckBox('Edit handles', self)
+        directFitCheckbox = QtGui.QCheckBox('Direct fit', self)
 
         self.toolbar.addSeparator()
         self.toolbar.addWidget(drawGazeCheckbox)
         self.toolbar.addWidget(showRawCheckbox)
         self.toolbar.addWidget(editHandlesCheckbox)
+        self.toolbar.addWidget(directFitCheckbox)
         self.toolbar.addAction(controlCursorAction)
         
         space = QtGui.QWidget(self)
@@ -159,6 +184,7 @@ class GazeWindow(basewindow.BaseMainWindow):
         gazeWidget.setdrawGazeEnabled(False)
         showRawCheckbox.toggled.connect(gazeWidget.setShowRaw)
         editHandlesCheckbox.toggled.connect(gazeWidget.setEditHandles)
+        directFitCheckbox.toggled.connect(gazeWidget.setDirectFit)
 
         # Start streaming gaze data
         self.tracker.start()
@@ -181,9 +207,11 @@ class GazeWindow(basewindow.BaseMainWindow):
         self.stimFunc = stimFunc
         if stimFunc:
             stimItem = stimFunc()
-            self.gazeWidget.loadStim(stimItem)
+            self.gazeWidget.loadStim(stimItem, distancefield.forStimulus(stimFunc))
         else:
             self.gazeWidget.loadStim(None)
+        self.gazeErrors.clear()
+        self.statusLabelError.clear()
         self.saveStim()
             
     def handleFrame(self, frame):
@@ -195,10 +223,18 @@ class GazeWindow(basewindow.BaseMainWindow):
         cpos = QtGui.QCursor.pos() - self._desktopWidget.screenGeometry(self.tracker.get('screenindex')).topLeft()
         frame['cursor_x'], frame['cursor_y'] = cpos.x(), cpos.y()
 
+        # Signed distance of the gaze from the stimulus outline (negative inside)
+        tracking = frame['state'] & EyeTribe.STATE_TRACKING_GAZE
+        frame['error'] = self.gazeWidget.stimulusError(frame['avg']) if tracking else float('nan')
+
         # Record the extended frame
         self.recorder.handleFrame(frame)
 
-        if frame['state'] & EyeTribe.STATE_TRACKING_GAZE:
+        if not math.isnan(frame['error']):
+            self.gazeErrors.append(abs(frame['error']))
+            self.statusLabelError.setText('Gaze error {:.0f} px'.format(sum(self.gazeErrors) / len(self.gazeErrors)))
+
+        if tracking:
             # get smoothed values
             x, y = self.gazeProcessor.process_frame(frame['raw']['x'], frame['raw']['y'])
             #temp
@@ -239,6 +275,30 @@ class GazeWindow(basewindow.BaseMainWindow):
         else:
             self.recorder.saveStim(None, None)
 
+    def saveStroke(self, stroke, points):
+        """ Save the points of a stroke, in screen coordinates like the gaze data """
+        self.recorder.saveStroke(stroke, self._sceneToScreen(points)[0])
+
+    def saveWarp(self, stroke, warp, steps):
+        """ Save the steps (x, y, dx, dy, radius, strength) of a warp, in screen coordinates """
+        targets, scale = self._sceneToScreen(steps[:, 0:2])
+        ends, _ = self._sceneToScreen(steps[:, 0:2] + steps[:, 2:4])
+        self.recorder.saveWarp(stroke, warp, np.column_stack([targets, ends - targets, steps[:, 4] * scale, steps[:, 5]]))
+
+    def _sceneToScreen(self, points):
+        """
+        Map an Nx2 array of points from the scene to the screen, relative to the top left corner
+        of this screen. Return the points and the scale from scene to screen distances.
+        """
+        w = self.gazeWidget
+        t = w.viewportTransform()
+        screenpos = self._desktopWidget.screenGeometry(self._desktopWidget.screenNumber(self)).topLeft()
+        offset = w.viewport().mapToGlobal(QPoint(0, 0)) - screenpos
+        x, y = np.asarray(points, dtype=float).reshape(-1, 2).T
+        screen = np.column_stack([t.m11() * x + t.m21() * y + t.dx() + offset.x(),
+                                  t.m12() * x + t.m22() * y + t.dy() + offset.y()])
+        return screen, math.sqrt(abs(t.determinant()))
+
     def resizeEvent(self, ev):
         if self.stimFunc:
 #            self.stimLabel.move(self.mapFromParent(self.geometry().center()) - self.stimLabel.rect().center())
@@ -251,8 +311,12 @@ class GazeWidget(QtGui.QGraphicsView):
     """
     Widget which shows real-time EyeTribe gaze data
     """
+    strokeDrawn = QtCore.Signal(int, object) # stroke number, Nx2 array of its points (scene coordinates)
+    strokeDiscarded = QtCore.Signal(int) # stroke number, of a stroke which could not be fitted
+    strokeWarped = QtCore.Signal(int, int, object) # stroke number, warp number, Nx6 array of warp steps (see warpSteps)
+    warpUndone = QtCore.Signal(int, bool) # warp number, undone (False when redone)
 
-    def __init__(self, tracker, parent=None):
+    def __init__(self, tracker, parent=None, historyBytes=8*1024*1024):
         super().__init__(parent)
       
         
@@ -272,6 +336,7 @@ class GazeWidget(QtGui.QGraphicsView):
         self.rawPaths =[]
         self.bezierPaths = []
         self.stimItem = None
+        self.stimField = None # distance field of the stimulus, in its item coordinates
         
         size = 20
         self.warpIndicatorItem = self.scene.addEllipse(-size/2, -size/2, size, size)
@@ -283,11 +348,34 @@ class GazeWidget(QtGui.QGraphicsView):
         self.nearestPath = None
         self.nearestPoint = None
         self.warping = False
-        self.warpPoints =[]
+        self.warpPoints = None # Nx2 array of points being warped
         self.warpPos = None
+        self.warpOrigin = None
+        self.warpSteps = [] # (x, y, dx, dy, radius, strength) of each step of the warp in progress
+        self.strokeCount = 0 # strokes drawn, to number them
+        self.warpCount = 0 # warps done, to number them
+        
+        # Undo/redo of contour edits, limited to historyBytes of stored deltas
+        self.history = EditHistory(historyBytes)
+        
+        # Curves are fitted in worker processes; contours show their raw points until then
+        self.fitPool = FitPool(parent=self)
+        self.fitPool.fitFinished.connect(self.handleFitFinished)
+        self.fitPool.fitFailed.connect(self.handleFitFailed)
+        self.fitPool.fitFinished.connect(self._runQueuedEdits)
+        self.fitPool.fitFailed.connect(self._runQueuedEdits)
+        QtCore.QCoreApplication.instance().aboutToQuit.connect(self.fitPool.shutdown)
+        self.fitCache = FitCache()
+        self._fitKeys = {} # contour item -> cache key of the fit in progress
+        self._fitOrigins = {} # contour item -> path elements before the edit being fitted
+        self._fitWarps = {} # contour item -> numbers of the warps whose result is being fitted
+        self._fitBatch = None # (items, changes) of a re-fit of all contours, undone together
+        self._queuedEdits = [] # undo/redo asked for while curves were being fitted, done when they are
         
         self.simpleness = 10
         self.smoothness = 5
+        self.fitMethod = fitting.BSPLINE
+        self.streamFitter = None # fits the stroke being drawn, in direct fitting mode
         self.warpRadius = 100
 
         # Gaze items
@@ -302,16 +390,31 @@ class GazeWidget(QtGui.QGraphicsView):
         self.tracker = tracker
         self.tracker.newFrame.connect(self.handleFrame)
 
-    def loadStim(self, stimItem):
+    def loadStim(self, stimItem, field=None):
         if self.stimItem is not None:
             self.scene.removeItem(self.stimItem)
 
         self.stimItem = stimItem
+        self.stimField = field
 
         if stimItem is not None:
             self.scene.addItem(stimItem)
             stimItem.setZValue(-1)
     
+    def stimulusError(self, gaze):
+        """ Signed distance of a gaze point ({'x':x, 'y':y}, in screen coordinates) from the stimulus outline """
+        if self.stimField is None:
+            return float('nan')
+        pos = self._translate(gaze) - self.stimItem.pos()
+        return float(self.stimField.sample([(pos.x(), pos.y())])[0])
+    
+    def strokeErrors(self, points):
+        """ Signed distances of an Nx2 array of scene points from the stimulus outline """
+        if self.stimField is None:
+            return None
+        pos = self.stimItem.pos()
+        return self.stimField.sample(points - (pos.x(), pos.y()))
+    
     def updateZValues(self, pos):
         """
         We need to select the closest object to the cursor, if one is within a certain threshold.
@@ -332,8 +435,7 @@ class GazeWidget(QtGui.QGraphicsView):
         nearestPath = None
         minDist = None
         for p in self.bezierPaths:
-            # Get rough distances to find nearest path
-            _, distance = p.bezierPath().nearestPointT(pos, 0.01, 0.1)
+            _, _, (distance,) = p.pathData().nearest([(pos.x(), pos.y())])
             if nearestPath is None or distance < minDist:
                 nearestPath = p
                 minDist = distance
@@ -345,9 +447,8 @@ class GazeWidget(QtGui.QGraphicsView):
     
     def updateNearestPoint(self, path, pos):
         if path is not None:
-            # Get more precise nearest point on path
-            t, _ = path.bezierPath().nearestPointT(pos)
-            point =  path.path().pointAtPercent(t)
+            _, (xy,), _ = path.pathData().nearest([(pos.x(), pos.y())])
+            point = QPointF(*xy)
             self.warpIndicatorItem.setPos(point)
             self.warpIndicatorItem.show()
         else:
@@ -362,6 +463,8 @@ class GazeWidget(QtGui.QGraphicsView):
     def mousePressEvent(self, event):
         if self.editMode:
             mousePos = self.mapToScene(event.pos());
+            # All changes until the button is released are undone as one
+            self.history.beginGroup()
             if self.editHandles:
                 self.updateZValues(mousePos)
             else:
@@ -370,14 +473,21 @@ class GazeWidget(QtGui.QGraphicsView):
                 if self.nearestPath:
                     self.warping = True
                     self.warpPos = mousePos
-                    self.warpPoints = self.nearestPath.bezierPath().interpolateToPoints(self.nearestPath.path().length())
+                    self.warpOrigin = self.nearestPath.pathData()
+                    self.warpPoints = self.warpOrigin.resample()
+                    self.warpSteps = []
                     self.nearestPath.deleteHandles()
             return super().mousePressEvent(event)
                 
 
         if (event.button() == Qt.LeftButton):
             self.scribbling = True;
-            self.scribblePath.moveTo(self.mapToScene(event.pos()))
+            pos = self.mapToScene(event.pos())
+            self.scribblePath.moveTo(pos)
+            if self.fitMethod == fitting.DIRECT:
+                # Fit curves as the stroke is drawn, so only its tail is left to fit on release
+                self.streamFitter = fitting.StreamingFitter(self.simpleness)
+                self.streamFitter.addPoint(pos.x(), pos.y())
             self.updateScribblePath()
             self.update()
 
@@ -394,15 +504,21 @@ class GazeWidget(QtGui.QGraphicsView):
                 if self.nearestPath:
                     if self.warping and (event.buttons() & Qt.LeftButton):
                         delta = mousePos - self.warpPos
-                        self.warpPoints = bezier.BezierPath.warpPoints(self.warpPoints, self.nearestPoint, delta, strength=0.9, radius=self.warpRadius)
-                        self.nearestPath.setPath(bezier.BezierPath.pathFromPoints(self.warpPoints))
+                        step = (self.nearestPoint.x(), self.nearestPoint.y(), delta.x(), delta.y(), self.warpRadius, 0.9)
+                        self.warpPoints = bezier.geometry.warpPoints(self.warpPoints, step[:2], step[2:4],
+                                                                     strength=step[5], radius=step[4])
+                        self.warpSteps.append(step)
+                        self.nearestPath.setPath(PathData.fromPoints(self.warpPoints).toPainterPath())
                         self.warpPos = mousePos
                         self.nearestPoint += delta
                         self.warpIndicatorItem.setPos(self.nearestPoint)
                         
         
         if (event.buttons() & Qt.LeftButton) and self.scribbling:
-            self.scribblePath.lineTo(self.mapToScene(event.pos()))
+            pos = self.mapToScene(event.pos())
+            self.scribblePath.lineTo(pos)
+            if self.streamFitter is not None:
+                self.streamFitter.addPoint(pos.x(), pos.y())
             self.updateScribblePath()
             self.update()
 
@@ -413,11 +529,20 @@ class GazeWidget(QtGui.QGraphicsView):
                 pass
             else:
                 if self.warping:
-                    self.nearestPath.setPath(self.nearestPath.bezierPath().simplify(self.simpleness).interpolateBSpline2(self.smoothness))
-                    self.nearestPath.makeHandles()
+                    # Re-fit the warped points; the warped polyline is shown until the fit is done
+                    if self.warpSteps:
+                        warp = self.warpCount
+                        self.warpCount += 1
+                        self._fitWarps.setdefault(self.nearestPath, []).append(warp)
+                        self.strokeWarped.emit(self.nearestPath.strokeNumber, warp, np.array(self.warpSteps))
+                    self.fitPath(self.nearestPath, self.warpPoints, self.warpOrigin)
                     self.warping = False
-                
-            return super().mouseReleaseEvent(event)
+                    self.warpOrigin = None
+                    self.warpSteps = []
+            
+            result = super().mouseReleaseEvent(event)
+            self.history.endGroup()
+            return result
         
         if event.button() == Qt.LeftButton and self.scribbling:
             self.scribbling = False;
@@ -426,15 +551,11 @@ class GazeWidget(QtGui.QGraphicsView):
             try:
                 if self.scribblePath.elementCount() > 1:
                     
-                    finalPath = self.scribblePath.simplify(self.simpleness)
-                    logger.debug('Finalizing path of {} -> {} elements (length {} -> {})'.format(self.scribblePath.elementCount(), finalPath.elementCount(),
-                                                                                            self.scribblePath.length(), finalPath.length() ))
-                    
-                    if self.editHandles or 1:
-                        finalPath = finalPath.interpolateBSpline2(self.smoothness)
-                    
-                    newItem = bezier.BezierPathItem(finalPath, None, self.scene) # This adds it to the scene
-                    
+                    # Show the raw stroke (without handles) until the fitted curve is ready
+                    newItem = bezier.BezierPathItem(self.scribblePath, None, self.scene, handles=False) # This adds it to the scene
+                    newItem.onElementsMoved = self.handleElementsMoved
+                    newItem.strokeNumber = self.strokeCount
+                    self.strokeCount += 1
                     self.bezierPaths.append(newItem)
                     rawItem = QtGui.QGraphicsPathItem(self.scribblePath, None, self.scene)
                     self.rawPaths.append(rawItem)
@@ -443,13 +564,34 @@ class GazeWidget(QtGui.QGraphicsView):
                     else:
                         rawItem.hide()
                     
-                        
+                    # Finish the curves fitted while drawing, or fit the whole stroke in the background
+                    if self.streamFitter is not None:
+                        points = np.array(self.streamFitter.points, dtype=float).reshape(-1, 2)
+                    else:
+                        points = PathData.fromPainterPath(self.scribblePath).points
+                    self.strokeDrawn.emit(newItem.strokeNumber, points)
+                    errors = self.strokeErrors(points)
+                    if errors is not None:
+                        logger.info('Stroke distance from stimulus: mean {:.1f} px, max {:.1f} px'.format(
+                            np.abs(errors).mean(), np.abs(errors).max()))
+                    if self.streamFitter is not None:
+                        try:
+                            result = self.streamFitter.finish()
+                        except ValueError as e:
+                            self.handleFitFailed(newItem, e)
+                        else:
+                            newItem.sourcePoints = points
+                            self.handleFitFinished(newItem, result.curves)
+                    else:
+                        self.fitPath(newItem, points)
+                    
                 else:
                     logger.debug('Discarding path of insufficient length.')
             except:
                 raise
             finally:
                 # clear temp path
+                self.streamFitter = None
                 self.scribblePath = bezier.BezierPath()
                 self.updateScribblePath()
                 self.update()
@@ -459,13 +601,108 @@ class GazeWidget(QtGui.QGraphicsView):
         self.setWarpRadius(self.warpRadius + event.delta()/10)
     
     def simplifyAllPaths(self):
+        if self.bezierPaths:
+            self._fitBatch = (set(self.bezierPaths), [])
         for p in self.bezierPaths:
-            path = bezier.BezierPath.pathFromPoints(p.bezierPath().interpolateToPoints(p.path().length()))
-            path = path.simplify(self.simpleness)
-            if self.editHandles or 1:
-                path = path.interpolateBSpline2(self.smoothness)
-            p.setPath(path)
-            p.makeHandles()
+            # Re-fit from the points the contour was last fitted to, unless its handles were moved since
+            points = p.sourcePoints
+            current = p.pathData()
+            if points is None:
+                points = current.resample()
+            self.fitPath(p, points, current)
+    
+    def fitPath(self, item, points, origin=None):
+        """
+        Fit a curve to an Nx2 array of points in the background, and swap it into item when done.
+        A later fit of the same item supersedes this one. If origin (the elements of item's path
+        before the edit) is given, the change is recorded in the edit history.
+        """
+        if origin is not None:
+            self._fitOrigins.setdefault(item, origin)
+        item.sourcePoints = points
+        key = self.fitCache.key(points, self.simpleness, self.smoothness, self.fitMethod)
+        curves = self.fitCache.get(key)
+        if curves is not None:
+            self.fitPool.cancel(item)
+            self._fitKeys.pop(item, None) # the cancelled fit must not be cached as these curves
+            self.handleFitFinished(item, curves)
+        else:
+            self._fitKeys[item] = key
+            self.fitPool.submit(item, points, self.simpleness, self.smoothness, self.fitMethod)
+    
+    def handleFitFinished(self, item, curves):
+        if item not in self.bezierPaths:
+            return # cleared in the meantime
+        key = self._fitKeys.pop(item, None)
+        if key is not None:
+            self.fitCache.put(key, curves)
+        path = bezier.BezierPath.pathFromCurves(curves)
+        logger.debug('Fitted path: {} -> {} elements'.format(item.path().elementCount(), path.elementCount()))
+        origin = self._fitOrigins.pop(item, None)
+        item.setPath(path)
+        item.makeHandles()
+        self._recordFit(item, origin, path)
+    
+    def handleFitFailed(self, item, error):
+        if item not in self.bezierPaths:
+            return
+        self._fitKeys.pop(item, None)
+        origin = self._fitOrigins.pop(item, None)
+        if origin is None and not (self._fitBatch and item in self._fitBatch[0]):
+            # A new stroke which could not be fitted: discard it
+            self._fitWarps.pop(item, None)
+            i = self.bezierPaths.index(item)
+            self.scene.removeItem(self.bezierPaths.pop(i))
+            self.scene.removeItem(self.rawPaths.pop(i))
+            self.strokeDiscarded.emit(item.strokeNumber)
+        else:
+            item.makeHandles()
+            self._recordFit(item, origin, None)
+    
+    def _recordFit(self, item, origin, path):
+        """ Add a finished fit to the history. Fits from re-fitting all contours are grouped """
+        warps = self._fitWarps.pop(item, [])
+        change = (item, origin, path, warps) if origin is not None and path is not None else None
+        if self._fitBatch and item in self._fitBatch[0]:
+            items, changes = self._fitBatch
+            items.discard(item)
+            if change:
+                changes.append(change)
+            if not items:
+                self.history.recordReplaces(changes)
+                self._fitBatch = None
+        elif change:
+            self.history.recordReplace(*change)
+    
+    def handleElementsMoved(self, item, indices, old, new):
+        """ Handles were dragged: the contour no longer matches the points it was fitted to """
+        item.sourcePoints = None
+        self.history.recordMove(item, indices, old, new)
+    
+    def undo(self):
+        self._edit(undo=True)
+    
+    def redo(self):
+        self._edit(undo=False)
+    
+    def _edit(self, undo):
+        """ Undo or redo, or queue it until the pending fits are done (their results are edits too) """
+        if self.fitPool.isPending() or self._queuedEdits:
+            logger.info('{} queued until curves are fitted'.format('Undo' if undo else 'Redo'))
+            self._queuedEdits.append(undo)
+            return
+        for d in (self.history.undo() if undo else self.history.redo()):
+            d.item.sourcePoints = None
+            for warp in d.warps:
+                self.warpUndone.emit(warp, undo)
+        self.update()
+    
+    def _runQueuedEdits(self, *args):
+        if self.fitPool.isPending():
+            return
+        queued, self._queuedEdits = self._queuedEdits, []
+        for undo in queued:
+            self._edit(undo)
 
     def _translate(self, p):
         """
@@ -508,9 +745,18 @@ class GazeWidget(QtGui.QGraphicsView):
 
     def clear(self):
         for p in self.bezierPaths:
+            self.fitPool.cancel(p)
             self.scene.removeItem(p)
+        self._fitKeys.clear()
+        self._fitOrigins.clear()
+        self._fitWarps.clear()
+        self._fitBatch = None
+        self._queuedEdits = []
         self.bezierPaths.clear()
         self.rawPaths.clear()
+        self.strokeCount = 0
+        self.warpCount = 0
+        self.history.clear()
         self.update()
     
     def setdrawGazeEnabled(self, v):
@@ -549,6 +795,14 @@ class GazeWidget(QtGui.QGraphicsView):
     def setSmoothness(self, x):
         self.simpleness = x/2
     
+    def setDirectFit(self, v):
+        """
+        Set whether strokes are fitted directly with Bezier curves (the smoothness slider then sets
+        the maximum distance of the curve from the stroke), or with a smoothing B-spline
+        """
+        self.fitMethod = fitting.DIRECT if v else fitting.BSPLINE
+        logger.info('Now fitting curves with method: {}'.format(self.fitMethod))
+    
     def setWarpRadius(self, x):
         self.warpRadius = x
         self.warpIndicatorItem.setRect(-x/2, -x/2, x, x)
@@ -0,0 +1,167 @@
+import collections
+
+from vectorbrush.pathdata import PathData
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class MoveDelta(object):
+    """
+    Some elements of a contour moved, but the structure of its path did not change.
+    Only the indices of the moved elements and how far each moved are stored.
+    """
+    warps = () # see ReplaceDelta
+
+    def __init__(self, item, indices, old, new):
+        self.item = item
+        self.indices = []
+        self.offsets = [] # [dx, dy] of each element
+        self._slots = {}
+        self.merge(indices, old, new)
+
+    @property
+    def nbytes(self):
+        return 24 * len(self.indices)
+
+    def merge(self, indices, old, new):
+        """ Fold a later move into this one, adding up the offsets of each element """
+        for i, o, n in zip(indices, old, new):
+            dx, dy = n[0] - o[0], n[1] - o[1]
+            slot = self._slots.get(i)
+            if slot is None:
+                self._slots[i] = len(self.indices)
+                self.indices.append(i)
+                self.offsets.append([dx, dy])
+            else:
+                self.offsets[slot][0] += dx
+                self.offsets[slot][1] += dy
+
+    def apply(self, undo):
+        sign = -1 if undo else 1
+        self.item.translateElements(self.indices, [(sign * dx, sign * dy) for dx, dy in self.offsets])
+
+
+class ReplaceDelta(object):
+    """
+    A contour was replaced by one with a different structure (e.g. by a warp or a re-fit).
+    Both versions are stored as PathData arrays. warps are the numbers of the warp edits which
+    made the change, if any.
+    """
+    def __init__(self, item, old, new, warps=()):
+        self.item = item
+        self.old = old
+        self.new = new
+        self.warps = tuple(warps)
+
+    @property
+    def nbytes(self):
+        return self.old.nbytes + self.new.nbytes
+
+    def apply(self, undo):
+        self.item.setPath((self.old if undo else self.new).toPainterPath())
+        self.item.makeHandles()
+
+
+class EditHistory(object):
+    """
+    Undo/redo history of contour edits.
+
+    Each entry is a list of deltas which are undone together. Between beginGroup() and endGroup()
+    all recorded edits go into a single entry, and repeated moves of the same contour are coalesced,
+    so a whole mouse drag becomes one compact entry. When the total size of the stored deltas
+    exceeds maxBytes, the oldest entries are dropped.
+    """
+    def __init__(self, maxBytes=8*1024*1024):
+        self.maxBytes = maxBytes
+        self.nbytes = 0
+        self._undo = collections.deque()
+        self._redo = []
+        self._group = None
+
+    def canUndo(self):
+        return bool(self._undo)
+
+    def canRedo(self):
+        return bool(self._redo)
+
+    def beginGroup(self):
+        self.endGroup()
+        self._group = []
+
+    def endGroup(self):
+        group, self._group = self._group, None
+        if group:
+            self._push(group)
+
+    def recordMove(self, item, indices, old, new):
+        """ Record that elements `indices` of item's path moved from `old` to `new` positions """
+        if self._group is not None:
+            for d in self._group:
+                if isinstance(d, MoveDelta) and d.item is item:
+                    d.merge(indices, old, new)
+                    return
+            self._group.append(MoveDelta(item, indices, old, new))
+        else:
+            self._push([MoveDelta(item, indices, old, new)])
+
+    def recordReplace(self, item, oldPath, newPath, warps=()):
+        """ Record that item's path was replaced (by the given warp edits). Paths are QPainterPaths or PathData """
+        self.recordReplaces([(item, oldPath, newPath, warps)])
+
+    def recordReplaces(self, changes):
+        """ Record several replaced paths, given as (item, oldPath, newPath, warps), which are undone together """
+        deltas = []
+        for item, oldPath, newPath, warps in changes:
+            if not isinstance(oldPath, PathData):
+                oldPath = PathData.fromPainterPath(oldPath)
+            if not isinstance(newPath, PathData):
+                newPath = PathData.fromPainterPath(newPath)
+            deltas.append(ReplaceDelta(item, oldPath, newPath, warps))
+        if self._group is not None:
+            self._group.extend(deltas)
+        elif deltas:
+            self._push(deltas)
+
+    def undo(self):
+        """ Undo the latest entry, and return its deltas """
+        self.endGroup()
+        if not self._undo:
+            return []
+        entry = self._undo.pop()
+        for d in reversed(entry):
+            d.apply(undo=True)
+        self._redo.append(entry)
+        return list(entry)
+
+    def redo(self):
+        """ Redo the latest undone entry, and return its deltas """
+        self.endGroup()
+        if not self._redo:
+            return []
+        entry = self._redo.pop()
+        for d in entry:
+            d.apply(undo=False)
+        self._undo.append(entry)
+        return list(entry)
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+        self._group = None
+        self.nbytes = 0
+
+    def _push(self, entry):
+        self.nbytes -= sum(self._entryBytes(e) for e in self._redo)
+        self._redo.clear()
+        self._undo.append(entry)
+        self.nbytes += self._entryBytes(entry)
+
+        # Evict the oldest entries over budget, but always keep the latest one
+        while self.nbytes > self.maxBytes and len(self._undo) > 1:
+            self.nbytes -= self._entryBytes(self._undo.popleft())
+        logger.debug('Edit history: {} entries, {} bytes'.format(len(self._undo), self.nbytes))
+
+    @staticmethod
+    def _entryBytes(entry):
+        return sum(d.nbytes for d in entry)
@@ -1,6 +1,8 @@
 from PySide import QtGui, QtCore
 from PySide.QtCore import Qt
 
+from vectorbrush.pathdata import PathData
+
 def dot(d):
     dot = QtGui.QGraphicsEllipseItem(-d/2,-d/2,d, d)
     dot.setBrush(QtGui.QBrush(Qt.black))
@@ -37,7 +39,7 @@ def organ():
     item.setBrush(brush)
     return item
 
-def ct():
+def ctOutline():
     p = QtGui.QPainterPath()
     p.moveTo(7.99702, -207.977)
     p.cubicTo(108.706, -211.455, 155.229, -168.755, 203.768, -104.033)
@@ -51,7 +53,10 @@ def ct():
     p.cubicTo(-237.653, 90.1136, -234.519, 16.175, -226.434, -10.0246)
     p.cubicTo(-200.118, -95.2954, -186.138, -130.67, -134.662, -166.566)
     p.cubicTo(-96.174, -193.405, -76.5979, -206.538, 7.02049, -207.978)
-    
+    return p
+
+def ct():
+    p = ctOutline()
     pixmap = QtGui.QPixmap('images/ct.png')
     item = QtGui.QGraphicsPixmapItem(pixmap)
     item.setOffset(-pixmap.width()/2, -pixmap.height()/2)
@@ -64,3 +69,49 @@ def ct():
     return item
 
 stimuli = [dot5, dot30, circle600, organ, ct]
+
+# Outlines of stimuli drawn with images, which can't be made without a QApplication
+outlines = {ct: ctOutline}
+
+# Outlines made by stimulusOutline, by stimulus function
+_outlineCache = {}
+
+
+def stimulusContour(item):
+    """
+    Return the outline of a stimulus item, in the coordinates of its parent, as PathData
+    (which can be analysed without Qt). The contour is kept on the item while it stays in place,
+    so analysing it again reuses its cached lengths; do not modify it.
+    """
+    pos = (item.pos().x(), item.pos().y())
+    cached = getattr(item, '_contour', None)
+    if cached is not None and cached[0] == pos:
+        return cached[1]
+    if hasattr(item, 'path'):
+        path = item.path()
+    else:
+        path = QtGui.QPainterPath()
+        path.addEllipse(item.rect())
+    contour = PathData.fromPainterPath(path)
+    contour = PathData(contour.points + pos, contour.types)
+    item._contour = (pos, contour)
+    return contour
+
+
+def stimulusOutline(stimFunc):
+    """
+    Return the outline of the item made by a stimulus function, in the item's coordinates, as
+    PathData. Stimuli with an outline function are not drawn, so this works without a GUI.
+    Outlines are made once per stimulus and shared; do not modify them.
+    """
+    contour = _outlineCache.get(stimFunc)
+    if contour is None:
+        outline = outlines.get(stimFunc)
+        if outline is not None:
+            contour = PathData.fromPainterPath(outline())
+        else:
+            item = stimFunc()
+            item.setPos(0, 0)
+            contour = stimulusContour(item)
+        _outlineCache[stimFunc] = contour
+    return contour
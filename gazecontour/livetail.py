@@ -0,0 +1,131 @@
+import collections
+
+import numpy as np
+
+from gazecontour.realtime import GazeProcessor
+from gazecontour.pipeline import signalsDataFrame
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Recorded columns kept for analysis
+COLUMNS = ('time', 'raw_x', 'raw_y', 'avg_x', 'avg_y', 'cursor_x', 'cursor_y')
+
+
+class LiveTail(object):
+    """
+    The signals of a recording in progress, extended as frames are recorded.
+
+    Each update takes only the frames recorded since the last one from the Recorder, and
+    extends the columns, the gaze speed and the fixations (found by the same real-time
+    algorithm, which is carried on from where it stopped). The arrays grow by doubling, so an
+    update costs about the number of new frames however long the recording is. Signals are
+    read like those of a Pipeline: tail['raw_x'], tail['speed'], tail['fixations'], and are
+    computed by the speed node and with the fixation parameters of the given Pipeline.
+    As in session.prepare, times are in seconds from the first frame and only samples with a
+    gaze position are kept.
+    """
+    def __init__(self, recorder, signals):
+        self.recorder = recorder
+        self.signals = signals
+        self.reset()
+
+    def reset(self):
+        self.cursor = None
+        self.size = 0
+        self.startTime = None
+        self._arrays = {}
+        self._processor = GazeProcessor(**self.signals.params('fixations'))
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, name):
+        return name in self._arrays or name == 'fixations'
+
+    def __getitem__(self, name):
+        if name == 'fixations':
+            return (self['fixation_x'], self['fixation_y'])
+        try:
+            return self._arrays[name][:self.size]
+        except KeyError:
+            return np.empty(0)
+
+    def params(self, name):
+        return self.signals.params(name)
+
+    def setParams(self, name, **params):
+        """ Change parameters in the pipeline, and compute the derived signals of the whole recording again """
+        self.signals.setParams(name, **params)
+        self._processor = GazeProcessor(**self.signals.params('fixations'))
+        if self.size == 0:
+            return
+        fx, fy = self._processor.process_arrays(self['raw_x'], self['raw_y'])
+        self._arrays['fixation_x'][:self.size] = fx
+        self._arrays['fixation_y'][:self.size] = fy
+        self._computeSpeed(0, 0)
+
+    def toDataFrame(self, names):
+        """ Return the recorded columns and the given derived signals, for export (see Pipeline.toDataFrame) """
+        return signalsDataFrame(collections.OrderedDict((c, self[c]) for c in COLUMNS), self, names)
+
+    def update(self):
+        """
+        Take in the frames recorded since the last update. Return the first sample whose values
+        changed (0 if the recording was cleared and all samples are new), or None if there are
+        no new samples
+        """
+        snapshot = self.recorder.framesSince(self.cursor)
+        if snapshot.restarted:
+            logger.debug('Recording was cleared, following it from the start')
+            self.reset()
+        self.cursor = snapshot.cursor
+        df = snapshot.frames
+        if len(df) == 0:
+            return 0 if snapshot.restarted else None
+        if self.startTime is None:
+            self.startTime = float(df['time'].values[0])
+        df = df[df['raw_x'] != 0.0]
+        count = len(df)
+        if count == 0:
+            return 0 if snapshot.restarted else None
+
+        old, new = self.size, self.size + count
+        for name in COLUMNS:
+            values = df[name].values.astype(float) if name in df else np.full(count, np.nan)
+            if name == 'time':
+                values = (values - self.startTime) / 1000.0
+            self._append(name, values)
+        self._append('fixation_x', np.empty(count))
+        self._append('fixation_y', np.empty(count))
+        self._append('speed', np.empty(count))
+        self.size = new
+
+        fx, fy = self._processor.process_arrays(df['raw_x'].values, df['raw_y'].values)
+        self._arrays['fixation_x'][old:new] = fx
+        self._arrays['fixation_y'][old:new] = fy
+
+        # Speed takes central differences of positions over central differences of times, so
+        # that of the last two old samples changes too; compute it from the two samples before
+        changed = max(old - 2, 0)
+        self._computeSpeed(max(old - 4, 0), changed)
+        return 0 if snapshot.restarted else changed
+
+    def _computeSpeed(self, first, changed):
+        """ Compute the speed of samples changed on, from samples first on, with the pipeline's speed node """
+        if self.size < 2:
+            self._arrays['speed'][:self.size] = 0.0
+            return
+        node = self.signals.nodes['speed']
+        speed = node.func(*[self[i][first:] for i in node.inputs], **node.params)
+        self._arrays['speed'][changed:self.size] = speed[changed - first:]
+
+    def _append(self, name, values):
+        """ Store values after the first self.size values of an array, growing it if it is full """
+        array = self._arrays.get(name)
+        if array is None or len(array) < self.size + len(values):
+            grown = np.empty(max(2 * (self.size + len(values)), 1024))
+            if array is not None:
+                grown[:self.size] = array[:self.size]
+            array = self._arrays[name] = grown
+        array[self.size:self.size + len(values)] = values
@@ -0,0 +1,168 @@
+import collections
+
+import numpy as np
+import scipy.spatial
+
+from vectorbrush.pathdata import PathData
+
+# Number of set bits in each byte value
+_BIT_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(packed):
+    """ Count the set bits in each row (last axis) of an array of packed uint8 bits """
+    return _BIT_COUNTS[packed].sum(axis=-1, dtype=np.int64)
+
+
+def contourPoints(contour, cellSize=1.0):
+    """ Return a contour (PathData, or an Nx2 array of points) as an Nx2 array of polygon vertices """
+    if isinstance(contour, PathData):
+        return contour.flatten(cellSize / 4)
+    return np.asarray(contour, dtype=float).reshape(-1, 2)
+
+
+def gridFor(polygons, cellSize=1.0):
+    """
+    Return (origin, shape) of the smallest grid of square cells of size cellSize which covers
+    the polygons (Nx2 arrays). Grids are aligned to multiples of cellSize, so the cells of any two
+    grids with the same cellSize coincide.
+    """
+    points = np.concatenate([np.asarray(p, dtype=float).reshape(-1, 2) for p in polygons])
+    lo = np.floor(points.min(axis=0) / cellSize) - 1
+    hi = np.ceil(points.max(axis=0) / cellSize) + 1
+    cols, rows = (hi - lo).astype(int)
+    return lo * cellSize, (rows, cols)
+
+
+def rasterize(polygon, origin, cellSize, shape):
+    """
+    Scan-convert a closed polygon (Nx2 array of vertices) into a boolean mask of the grid with
+    the given origin (x, y of its top-left corner), cellSize and shape (rows, cols). A cell is
+    inside if its center has a nonzero winding number, so self-intersecting polygons (which gaze
+    strokes often are) are filled sensibly.
+
+    Each edge adds +1 or -1 to the first cell to the right of where it crosses each row of cell
+    centers; the winding numbers are then the running sums along the rows.
+    """
+    rows, cols = shape
+    p = (np.asarray(polygon, dtype=float).reshape(-1, 2) - origin) / cellSize - 0.5 # cell center coordinates
+    if len(p) < 3:
+        return np.zeros(shape, dtype=bool)
+    x1, y1 = p[:, 0], p[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+
+    # Rows r with min(y1, y2) <= r < max(y1, y2) are crossed by each edge
+    lo = np.clip(np.ceil(np.minimum(y1, y2)), 0, rows).astype(int)
+    hi = np.clip(np.ceil(np.maximum(y1, y2)), 0, rows).astype(int)
+    counts = hi - lo
+    edges = np.repeat(np.arange(len(p)), counts)
+    r = np.arange(len(edges)) - np.repeat(np.cumsum(counts) - counts, counts) + lo[edges]
+
+    x = x1[edges] + (r - y1[edges]) * (x2 - x1)[edges] / (y2 - y1)[edges]
+    c = np.clip(np.ceil(x), 0, cols).astype(int)
+    direction = np.where(y2 > y1, 1, -1)[edges]
+    winding = np.bincount(r * (cols + 1) + c, weights=direction, minlength=rows * (cols + 1))
+    return np.cumsum(winding.reshape(rows, cols + 1)[:, :cols], axis=1) != 0
+
+
+class Overlap(collections.namedtuple('Overlap', 'area referenceArea intersection union dice iou')):
+    """
+    Overlap of contours with a reference contour. Areas are in squared scene units; fields are
+    arrays when several contours were scored at once.
+    """
+
+
+class OverlapScorer(object):
+    """
+    Scores the overlap (Dice coefficient and intersection over union) of contours with one
+    reference contour, e.g. a stimulus.
+
+    Contours are scan-converted on a grid of square cells of size cellSize, and masks are stored
+    packed 8 cells to a byte, so intersections are bitwise ANDs and areas are popcounts. The
+    reference is rasterized once; a batch of contours is compared against it in one operation.
+    """
+    def __init__(self, reference, cellSize=1.0):
+        self.cellSize = cellSize
+        reference = contourPoints(reference, cellSize)
+        self.origin, self.shape = gridFor([reference], cellSize)
+        self.referenceBits = np.packbits(rasterize(reference, self.origin, cellSize, self.shape))
+        self.referenceCount = int(popcount(self.referenceBits))
+
+    def score(self, contour):
+        """ Return the Overlap of one contour """
+        return Overlap(*[v[0] for v in self.scoreBatch([contour])])
+
+    def scoreBatch(self, contours):
+        """ Return the Overlap of each of a sequence of contours (as arrays) """
+        rows, cols = self.shape
+        counts = np.empty(len(contours), dtype=np.int64)
+        bits = np.empty((len(contours), len(self.referenceBits)), dtype=np.uint8)
+        corners = self.origin + np.array([[0, 0], [cols, rows]]) * self.cellSize
+        for i, contour in enumerate(contours):
+            # Rasterize on a grid covering both contours, and cut out the reference's part of it
+            points = contourPoints(contour, self.cellSize)
+            origin, shape = gridFor([points, corners], self.cellSize)
+            mask = rasterize(points, origin, self.cellSize, shape)
+            counts[i] = np.count_nonzero(mask)
+            oy, ox = np.round((self.origin - origin)[::-1] / self.cellSize).astype(int)
+            bits[i] = np.packbits(mask[oy:oy + rows, ox:ox + cols])
+
+        cellArea = self.cellSize**2
+        intersection = popcount(bits & self.referenceBits) * cellArea
+        area = counts * cellArea
+        referenceArea = self.referenceCount * cellArea
+        union = area + referenceArea - intersection
+        total = area + referenceArea
+        dice = 2 * intersection / np.where(total > 0, total, 1)
+        iou = intersection / np.where(union > 0, union, 1)
+        return Overlap(area, referenceArea * np.ones(len(contours)), intersection, union, dice, iou)
+
+
+def contourSamples(contour, spacing=0.5):
+    """
+    Return points spaced at most `spacing` apart along a contour (PathData, or an Nx2 array of
+    polyline points), as an Nx2 array
+    """
+    if not isinstance(contour, PathData):
+        contour = PathData.fromPoints(contour)
+    return contour.resample(max(int(np.ceil(contour.length() / spacing)) + 1, 2))
+
+
+class Distances(collections.namedtuple('Distances', 'hausdorff mean median p95')):
+    """
+    Distances between the boundaries of a contour and a reference contour, in scene units:
+        hausdorff = symmetric Hausdorff distance (the largest distance from a point on either
+                    boundary to the other boundary)
+        mean, median, p95 = statistics of the surface distances, from both boundaries
+    """
+
+
+class DistanceScorer(object):
+    """
+    Measures how far contours are from the boundary of one reference contour, e.g. a stimulus.
+
+    Both boundaries are sampled every `spacing` (so distances are accurate to about spacing/2)
+    and KD-trees of the samples find all the nearest points in one batch query each, in
+    O(n log m) time for n samples against m.
+    """
+    def __init__(self, reference, spacing=0.5):
+        self.spacing = spacing
+        self.referenceSamples = contourSamples(reference, spacing)
+        self.referenceTree = scipy.spatial.cKDTree(self.referenceSamples)
+
+    def distances(self, points):
+        """ Return the distances from each of an Nx2 array of points to the reference boundary """
+        distances, _ = self.referenceTree.query(np.asarray(points, dtype=float).reshape(-1, 2))
+        return distances
+
+    def score(self, contour):
+        """ Return the Distances between the boundaries of a contour and the reference """
+        samples = contourSamples(contour, self.spacing)
+        toReference = self.distances(samples)
+        fromReference, _ = scipy.spatial.cKDTree(samples).query(self.referenceSamples)
+        both = np.concatenate([toReference, fromReference])
+        return Distances(both.max(), both.mean(), np.median(both), np.percentile(both, 95))
+
+    def scoreBatch(self, contours):
+        """ Return the Distances of each of a sequence of contours, as arrays """
+        return Distances(*np.array([self.score(c) for c in contours]).reshape(-1, 4).T)
@@ -0,0 +1,167 @@
+import collections
+
+import pandas
+
+from gazecontour import diskcache
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def signalsDataFrame(columns, signals, names):
+    """
+    Return a DataFrame of source columns ({name: array}) and of the derived signals `names`
+    read from signals, e.g. to export them. Signals with several outputs (tuples) become
+    columns name_0, name_1, ...
+    """
+    df = pandas.DataFrame(columns)
+    for name in names:
+        value = signals[name]
+        if isinstance(value, tuple):
+            for i, v in enumerate(value):
+                df['{}_{}'.format(name, i)] = v
+        else:
+            df[name] = value
+    return df
+
+
+class Node(object):
+    """
+    A derived signal: func(*inputs, **params), where inputs name source columns or other nodes.
+    Increase version when func changes, so results cached on disk are not reused.
+    """
+    def __init__(self, name, func, inputs, params, version=1):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.params = dict(params)
+        self.version = version
+
+
+class Pipeline(object):
+    """
+    Lazily computed signals derived from a recording session.
+
+    The source holds the recorded columns of a whole session: a DataFrame, or a mapping of column
+    names to arrays (e.g. memory-mapped). Derived signals (speed, fixations, filters...) are
+    declared as nodes with their inputs and parameters. A signal is computed only when it is
+    first asked for, and the result is memoized for the session under its parameters and those
+    of everything it depends on. So changing a parameter recomputes only the signals downstream
+    of it, and changing it back finds the earlier results still cached. The source is never
+    modified.
+
+    With a DiskCache, results are also kept on disk under a hash of the source data (or a given
+    digest of the session), so reopening a session does not recompute them. window() gives the
+    signals of some rows of the session, e.g. those loaded of a WindowedSession.
+    """
+    def __init__(self, cache=None):
+        self.nodes = {}
+        self.source = pandas.DataFrame()
+        self.diskCache = cache
+        self._cache = {}
+        self._sourceDigest = None
+
+    def node(self, name, inputs, version=1, **params):
+        """ Decorator declaring func(*inputs, **params) as the signal `name` """
+        def decorator(func):
+            self.nodes[name] = Node(name, func, inputs, params, version)
+            return func
+        return decorator
+
+    def setSource(self, source, digest=None):
+        """
+        Start a new session: results for the previous one are dropped. digest identifies the
+        session's data in the disk cache; by default it is a hash of the source
+        """
+        self.source = source
+        self._cache.clear()
+        self._sourceDigest = digest
+
+    def sourceDigest(self):
+        """ Content hash of the source data """
+        if self._sourceDigest is None:
+            self._sourceDigest = diskcache.digest(self.source)
+        return self._sourceDigest
+
+    def params(self, name):
+        return dict(self.nodes[name].params)
+
+    def setParams(self, name, **params):
+        """ Change parameters of a node; its result, and those of the nodes using it, are recomputed when next needed """
+        node = self.nodes[name]
+        unknown = set(params) - set(node.params)
+        if unknown:
+            raise KeyError('Unknown parameters for {}: {}'.format(name, ', '.join(sorted(unknown))))
+        node.params.update(params)
+
+    def __contains__(self, name):
+        return name in self.nodes or name in self.source
+
+    def __getitem__(self, name):
+        """ Return a source column (as an array) or the value of a derived signal """
+        if name not in self.nodes:
+            return self.column(name)
+        key = self._key(name)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        node = self.nodes[name]
+        value = None
+        if self.diskCache is not None:
+            value = self.diskCache.get(self.sourceDigest(), name, node.version, {'key': key})
+        if value is None:
+            logger.debug('Computing {} with {}'.format(name, node.params))
+            value = node.func(*[self[i] for i in node.inputs], **node.params)
+            if self.diskCache is not None:
+                self.diskCache.put(self.sourceDigest(), name, node.version, value, {'key': key})
+        self._cache[key] = value
+        return value
+
+    def column(self, name):
+        """ Return a source column as an array """
+        values = self.source[name]
+        return getattr(values, 'values', values)
+
+    def window(self, start, stop, source=None):
+        """ Return the signals of rows start to stop of the session (see PipelineWindow) """
+        return PipelineWindow(self, start, stop, source)
+
+    def toDataFrame(self, names):
+        """ Return the source columns of the whole session and the given derived signals, for export (see signalsDataFrame) """
+        return signalsDataFrame(collections.OrderedDict((c, self.column(c)) for c in self.source), self, names)
+
+    def _key(self, name):
+        """ Identify a result by the node and the parameters of it and all its inputs """
+        if name not in self.nodes:
+            return name
+        node = self.nodes[name]
+        return (name, node.version, tuple(sorted(node.params.items())), tuple(self._key(i) for i in node.inputs))
+
+
+class PipelineWindow(object):
+    """
+    The signals of rows start to stop of a Pipeline's session, read like those of the Pipeline.
+
+    Derived signals are computed (and cached) for the whole session, and sliced: so they are the
+    same wherever the window is, and moving it computes nothing. Source columns are read from
+    source if given (a DataFrame of just these rows, e.g. read from a WindowedSession), or
+    sliced from the session's.
+    """
+    def __init__(self, pipeline, start, stop, source=None):
+        self.pipeline = pipeline
+        self.start = start
+        self.stop = stop
+        self.source = source
+
+    def __contains__(self, name):
+        return name in self.pipeline
+
+    def __getitem__(self, name):
+        if name not in self.pipeline.nodes and self.source is not None:
+            values = self.source[name]
+            return getattr(values, 'values', values)
+        value = self.pipeline[name]
+        if isinstance(value, tuple):
+            return tuple(v[self.start:self.stop] for v in value)
+        return value[self.start:self.stop]
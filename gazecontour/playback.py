@@ -0,0 +1,86 @@
+from PySide import QtCore
+
+from gazecontour.redraw import FRAME_MSECS
+
+
+# Playback speeds offered, as multiples of real time
+SPEEDS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0)
+
+
+class Playback(QtCore.QObject):
+    """
+    Moves a pyqtgraph LinearRegionItem along the time axis at `speed` times real time.
+
+    The position is computed from the time elapsed since playing started (or the speed last
+    changed), not by adding up the intervals between timer ticks. So late or skipped ticks
+    delay a frame but do not make playback drift. sigAdvanced is emitted after each move, to
+    redraw for the new region at once.
+    """
+    sigAdvanced = QtCore.Signal()
+    sigStateChanged = QtCore.Signal(bool) # playing
+
+    def __init__(self, region, frameMsecs=FRAME_MSECS, parent=None):
+        super().__init__(parent)
+        self.region = region
+        self.duration = 0.0
+        self.speed = 1.0
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(int(frameMsecs))
+        self._timer.timeout.connect(self._advance)
+        self._clock = QtCore.QElapsedTimer()
+        self._startRegion = (0.0, 0.0)
+
+    def isPlaying(self):
+        return self._timer.isActive()
+
+    def play(self):
+        if self.isPlaying():
+            return
+        self._rebase()
+        self._timer.start()
+        self.sigStateChanged.emit(True)
+
+    def pause(self):
+        if not self.isPlaying():
+            return
+        self._timer.stop()
+        self.sigStateChanged.emit(False)
+        self.region.lineMoveFinished()
+
+    def stop(self):
+        """ Pause and go back to the start, keeping the length of the region """
+        self._timer.stop()
+        self.sigStateChanged.emit(False)
+        x1, x2 = self.region.getRegion()
+        self.region.setRegion((0, x2 - x1))
+
+    def setSpeed(self, speed):
+        if self.isPlaying():
+            self._rebase()
+        self.speed = speed
+
+    def _rebase(self):
+        self._startRegion = self.region.getRegion()
+        self._clock.start()
+
+    def _advance(self):
+        offset = self.speed * self._clock.elapsed() / 1000.0
+        x1, x2 = self._startRegion
+        if x1 + offset >= self.duration:
+            offset = max(self.duration - x1, 0)
+            self._setRegion((x1 + offset, x2 + offset))
+            self.pause()
+            return
+        self._setRegion((x1 + offset, x2 + offset))
+        self.sigAdvanced.emit()
+
+    def _setRegion(self, rgn):
+        # Our own version of LinearRegionItem.setRegion, which does not emit sigRegionChangeFinished
+        r = self.region
+        if r.lines[0].value() == rgn[0] and r.lines[1].value() == rgn[1]:
+            return
+        r.blockLineSignal = True
+        r.lines[0].setValue(rgn[0])
+        r.blockLineSignal = False
+        r.lines[1].setValue(rgn[1])
+        r.lineMoved()
@@ -1,5 +1,14 @@
 import numpy as np
 
+
+def gazeSpeed(t, x, y):
+    """ Speed of gaze in pixels/sec, from arrays of sample times (seconds) and positions """
+    # Calculate from components
+    dt = np.gradient(t)
+    v = (np.gradient(x, dt), np.gradient(y, dt))
+    return np.linalg.norm(v, axis=0)
+
+
 class GazeProcessor(object):
     
     def __init__(self, N, px_thresh):
@@ -15,15 +24,15 @@ class GazeProcessor(object):
         self.new_fixation = False        
 
     def process_dataframe(self, df):
+        return self.process_arrays(df['raw_x'].values, df['raw_y'].values)
+
+    def process_arrays(self, xs, ys):
         
-        fixation_x = np.empty(len(df))
-        fixation_y = np.empty(len(df))    
+        fixation_x = np.empty(len(xs))
+        fixation_y = np.empty(len(xs))    
     
         # For each frame
-        for i in range(len(df)):
-            # get "new" x, y
-            x = df['raw_x'][i]
-            y = df['raw_y'][i]
+        for i, (x, y) in enumerate(zip(xs, ys)):
             # Save result of simulated real-time algorithm
             (fixation_x[i], fixation_y[i]) = self.process_frame(x,y)
         
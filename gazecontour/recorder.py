@@ -1,7 +1,13 @@
 import inspect
+import collections
 from PySide import QtCore, QtGui
+import numpy as np
 import pandas
 
+# Frames recorded since a cursor (see Recorder.framesSince)
+Snapshot = collections.namedtuple('Snapshot', 'frames cursor restarted')
+
+
 class Recorder(QtCore.QObject):
     """
     Takes incoming frame dicts, stores them, and records them to csv file on command
@@ -15,7 +21,11 @@ class Recorder(QtCore.QObject):
         self.data = [] # Save data as list of frame dicts, for now
         self.extraData = {}
         self.pathData = {}
+        self.strokeData = [] # (stroke number, Nx2 array of points) of each stroke drawn
+        self.warpData = [] # (stroke number, warp number, Nx6 array of steps) of each warp edit
+        self.undoneWarps = set() # numbers of the warp edits undone since
         self.recording = False
+        self._generation = 0 # increased when the data is cleared, to invalidate cursors
         self._desktopWidget = QtGui.QDesktopWidget()
         self.clear()
 
@@ -76,13 +86,79 @@ class Recorder(QtCore.QObject):
                                   'y': [p.y() for p in points]})
         
     
+    def saveStroke(self, stroke, points):
+        """ Save the raw points (Nx2 array) of a stroke, as drawn before fitting """
+        self.strokeData.append((stroke, np.asarray(points, dtype=float)))
+
+    def discardStroke(self, stroke):
+        """ Forget a stroke which was not kept, and its warp edits """
+        self.strokeData = [s for s in self.strokeData if s[0] != stroke]
+        self.warpData = [w for w in self.warpData if w[0] != stroke]
+
+    def saveWarp(self, stroke, warp, steps):
+        """
+        Save warp edit number `warp` of a stroke's contour: an Nx6 array of steps (x, y, dx, dy,
+        radius, strength), each moving the points within radius of (x, y) by up to (dx, dy)
+        """
+        self.warpData.append((stroke, warp, np.asarray(steps, dtype=float)))
+
+    def setWarpUndone(self, warp, undone=True):
+        """ Mark a warp edit as undone (or redone); undone edits are not saved """
+        if undone:
+            self.undoneWarps.add(warp)
+        else:
+            self.undoneWarps.discard(warp)
+
+    def strokesDataFrame(self):
+        """ Return the raw strokes as a DataFrame with columns stroke, x, y """
+        return self._concat([pandas.DataFrame({'stroke': stroke, 'x': p[:, 0], 'y': p[:, 1]}, columns=['stroke', 'x', 'y'])
+                             for stroke, p in self.strokeData], ['stroke', 'x', 'y'])
+
+    def warpsDataFrame(self):
+        """ Return the warp edits not undone as a DataFrame with columns stroke, edit (in order) and the steps """
+        columns = ['stroke', 'edit', 'x', 'y', 'dx', 'dy', 'radius', 'strength']
+        frames = []
+        for stroke, warp, steps in self.warpData:
+            if warp in self.undoneWarps:
+                continue
+            df = pandas.DataFrame(steps, columns=columns[2:])
+            df.insert(0, 'edit', warp)
+            df.insert(0, 'stroke', stroke)
+            frames.append(df)
+        return self._concat(frames, columns)
+
+    @staticmethod
+    def _concat(frames, columns):
+        return pandas.concat(frames, ignore_index=True) if frames else pandas.DataFrame(columns=columns)
+
     def clear(self):
         self.data.clear()
+        self.strokeData.clear()
+        self.warpData.clear()
+        self.undoneWarps.clear()
+        self._generation += 1
         self._statusLabel.setText('Recorder ready')
 
     def toDataFrame(self):
         """ Return a pandas.DataFrame with all data in memory up to this point """
-        df = pandas.DataFrame(self.data)
+        return self._toDataFrame(self.data)
+
+    def framesSince(self, cursor=None):
+        """
+        Return a Snapshot: a DataFrame of the frames recorded since cursor (from an earlier
+        Snapshot, or None for all frames), and the cursor to pass next time. Only the new frames
+        are copied. If the data was cleared since, all frames are returned with restarted True.
+        """
+        generation, start = cursor if cursor is not None else (self._generation, 0)
+        restarted = generation != self._generation
+        if restarted:
+            start = 0
+        stop = len(self.data)
+        return Snapshot(self._toDataFrame(self.data[start:stop]), (self._generation, stop), restarted)
+
+    @staticmethod
+    def _toDataFrame(frames):
+        df = pandas.DataFrame(frames)
         if len(df) > 0:
             df.set_index('timestamp', inplace=True)
             df.index.name = None
@@ -97,4 +173,6 @@ class Recorder(QtCore.QObject):
             self.toDataFrame().to_excel(writer, 'GazeData')
             pandas.DataFrame.from_dict(self.extraData, orient='index').to_excel(writer, 'Extra')
             pandas.DataFrame.from_dict(self.pathData).to_excel(writer, 'Path')
+            self.strokesDataFrame().to_excel(writer, 'Strokes', index=False)
+            self.warpsDataFrame().to_excel(writer, 'Warps', index=False)
             writer.save()
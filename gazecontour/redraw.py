@@ -0,0 +1,71 @@
+import time
+
+from PySide import QtCore
+
+
+# Shortest time between redraws, in ms: one frame of a 60 Hz display
+FRAME_MSECS = 1000.0 / 60
+
+
+class RedrawScheduler(QtCore.QObject):
+    """
+    Coalesces redraw requests. However often request() is called (e.g. for each mouse event
+    while dragging), callback is called at most once per frameMsecs, after the latest request,
+    so it always draws the latest state.
+    """
+    def __init__(self, callback, frameMsecs=FRAME_MSECS, parent=None):
+        super().__init__(parent)
+        self.callback = callback
+        self.frameMsecs = frameMsecs
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._run)
+        self._clock = QtCore.QElapsedTimer()
+        self._clock.start()
+        self._lastRun = -frameMsecs
+
+    def request(self):
+        """ Redraw as soon as a frame has passed since the last redraw """
+        if self._timer.isActive():
+            return
+        wait = self.frameMsecs - (self._clock.elapsed() - self._lastRun)
+        self._timer.start(max(int(wait), 0))
+
+    def flush(self):
+        """ Redraw now if a redraw is pending """
+        if self._timer.isActive():
+            self._timer.stop()
+            self._run()
+
+    def _run(self):
+        self._lastRun = self._clock.elapsed()
+        self.callback()
+
+
+class Timing(object):
+    """ Counts calls and their total and longest time, e.g. of a plot element's updates """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, secs):
+        self.count += 1
+        self.total += secs
+        self.max = max(self.max, secs)
+
+    def timed(self, func, *args):
+        """ Call func(*args), adding the time it takes """
+        t0 = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.add(time.perf_counter() - t0)
+
+    def __str__(self):
+        mean = self.total / self.count if self.count else 0.0
+        return '{} updates, {:.1f} ms total, {:.2f} ms mean, {:.2f} ms max'.format(
+            self.count, self.total * 1000, mean * 1000, self.max * 1000)
@@ -0,0 +1,230 @@
+"""
+Re-fit the strokes of saved recordings with other contour fitting parameters, without the GUI:
+
+    python -m gazecontour.refit data/ -o refit --method bspline direct --simpleness 2.5 5 10
+
+Each raw stroke is fitted again as when it was drawn, and its warp edits are replayed on the new
+contour, each followed by a re-fit as in the GUI. The contour is then scored against the
+stimulus. Recordings are processed in parallel. The scores are added to results.csv in the
+output directory (one row per recording, parameter set and stroke), and the contours are saved
+in its contours directory, as .npz files of Bezier control points. As in gazecontour.batch, an
+interrupted run can be resumed.
+"""
+import os
+import sys
+import time
+import argparse
+import itertools
+import collections
+import concurrent.futures
+
+import numpy as np
+import pandas
+
+from gazecontour import batch, metrics, diskcache
+from vectorbrush import fitting, geometry
+from vectorbrush.pathdata import PathData
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Columns of the results table
+COLUMNS = ('file', 'size', 'mtime', 'params', 'method', 'simpleness', 'smoothness',
+           'stroke', 'warps', 'segments', 'fitSeconds',
+           'area', 'stimArea', 'intersection', 'union', 'dice', 'iou',
+           'hausdorff', 'meanDistance', 'medianDistance', 'p95Distance',
+           'contours', 'error', 'written')
+
+
+class ParamSet(collections.namedtuple('ParamSet', 'method simpleness smoothness')):
+    """
+    Parameters of vectorbrush.fitting.fitContour. smoothness is None for the direct method,
+    which does not use it.
+    """
+    @property
+    def label(self):
+        if self.smoothness is None:
+            return '{}-{:g}'.format(self.method, self.simpleness)
+        return '{}-{:g}-{:g}'.format(self.method, self.simpleness, self.smoothness)
+
+
+def parameterGrid(methods, simpleness, smoothness):
+    """ Return the ParamSets of all combinations of the given values """
+    return [ParamSet(method, s, m)
+            for method in methods
+            for s, m in itertools.product(simpleness, smoothness if method == fitting.BSPLINE else [None])]
+
+
+def refitStroke(points, warps, params):
+    """
+    Fit a stroke (Nx2 array) as GazeWidget does, then replay its warp edits (Nx6 arrays of
+    steps, in order): warp evenly spaced points of the contour, and fit them again.
+    With the direct method the stroke is fitted by a StreamingFitter, as while drawing, which
+    gives different curves than fitting the whole stroke at once.
+    Return the Sx4x2 array of Bezier curves.
+    """
+    smoothness = 0 if params.smoothness is None else params.smoothness
+    if params.method == fitting.DIRECT:
+        fitter = fitting.StreamingFitter(params.simpleness)
+        fitter.addPoints(points)
+        curves = fitter.finish().curves
+    else:
+        curves = fitting.fitContour(points, params.simpleness, smoothness, params.method)
+    for steps in warps:
+        points = PathData.fromCurves(curves).resample()
+        for x, y, dx, dy, radius, strength in steps:
+            points = geometry.warpPoints(points, (x, y), (dx, dy), strength, radius)
+        curves = fitting.fitContour(points, params.simpleness, smoothness, params.method)
+    return curves
+
+
+def refitFile(filename, paramSets, contourDir, cellSize=0.5):
+    """
+    Re-fit the strokes of a recording with each ParamSet, and score them against the stimulus.
+    Return the rows of the results table.
+    """
+    stat = os.stat(filename)
+    base = {'file': filename, 'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+    try:
+        recording = batch.readRecording(filename, gaze=False)
+        if recording.stim is None:
+            raise ValueError('No stimulus recorded')
+        stimPath = batch.stimulusPath(recording.stim)
+        overlapScorer = metrics.OverlapScorer(stimPath, cellSize)
+        distanceScorer = metrics.DistanceScorer(stimPath)
+    except Exception as e:
+        logger.exception('Could not read {}'.format(filename))
+        error = '{}: {}'.format(type(e).__name__, e)
+        return [dict(base, params=p.label, error=error, **p._asdict()) for p in paramSets]
+
+    warps = collections.defaultdict(list)
+    for stroke, steps in recording.warps:
+        warps[stroke].append(steps)
+
+    rows = []
+    stem = '{}-{}'.format(os.path.splitext(os.path.basename(filename))[0], diskcache.digest(filename)[:8])
+    for params in paramSets:
+        paramRow = dict(base, params=params.label, **params._asdict())
+        if not recording.strokes:
+            rows.append(paramRow) # nothing to fit, but done
+            continue
+        fitted = collections.OrderedDict() # stroke -> (row, curves)
+        for stroke, points in recording.strokes.items():
+            row = dict(paramRow, stroke=stroke, warps=len(warps[stroke]))
+            rows.append(row)
+            t0 = time.perf_counter()
+            try:
+                fitted[stroke] = (row, refitStroke(points, warps[stroke], params))
+            except Exception as e: # as in FitPool, any failure of a fit only fails that stroke
+                row['error'] = '{}: {}'.format(type(e).__name__, e)
+            row['fitSeconds'] = time.perf_counter() - t0
+        if not fitted:
+            continue
+
+        contours = os.path.join(contourDir, '{}-{}.npz'.format(stem, params.label))
+        np.savez(contours, **{'stroke_{}'.format(s): curves for s, (_, curves) in fitted.items()})
+        paths = [PathData.fromCurves(curves) for _, curves in fitted.values()]
+        overlap = overlapScorer.scoreBatch(paths)
+        distances = distanceScorer.scoreBatch(paths)
+        for i, (row, curves) in enumerate(fitted.values()):
+            row.update(segments=len(curves), contours=contours,
+                       area=overlap.area[i], stimArea=overlap.referenceArea[i],
+                       intersection=overlap.intersection[i], union=overlap.union[i],
+                       dice=overlap.dice[i], iou=overlap.iou[i],
+                       hausdorff=distances.hausdorff[i], meanDistance=distances.mean[i],
+                       medianDistance=distances.median[i], p95Distance=distances.p95[i])
+    return rows
+
+
+def readResults(output):
+    """ Return the results table in output, with the rows of the latest run of each recording and parameter set, or None """
+    table = batch.readResults(output, keys=('file', 'params', 'stroke'))
+    if table is None:
+        return None
+    latest = table.groupby(['file', 'params'])['written'].transform('max')
+    return table[table['written'] == latest]
+
+
+def done(table):
+    """
+    Return {(file, params): (size, mtime)} of the recordings and parameter sets finished in a
+    results table: those with strokes fitted, or nothing to fit
+    """
+    if table is None:
+        return {}
+    ok = table[table['stroke'].notnull() | table['error'].isnull()]
+    return {(f, p): (int(size), int(mtime))
+            for f, p, size, mtime in zip(ok['file'], ok['params'], ok['size'], ok['mtime'])}
+
+
+def run(filenames, outputDir, paramSets, jobs=None, resume=True, cellSize=0.5):
+    """
+    Re-fit the strokes of recordings with each ParamSet in a pool of `jobs` processes (default:
+    one per CPU), one recording per job. With resume, parameter sets already in the results
+    table for an unchanged recording are skipped. Return the number of recordings processed.
+    """
+    output = os.path.join(outputDir, 'results.csv')
+    contourDir = os.path.join(outputDir, 'contours')
+    os.makedirs(contourDir, exist_ok=True)
+    if not resume and os.path.exists(output):
+        os.remove(output)
+    previous = done(readResults(output))
+
+    todo = collections.OrderedDict()
+    for f in filenames:
+        stat = os.stat(f)
+        key = (stat.st_size, int(stat.st_mtime))
+        sets = [p for p in paramSets if previous.get((f, p.label)) != key]
+        if sets:
+            todo[f] = sets
+    logger.info('{} recordings to re-fit with {} parameter sets'.format(len(todo), len(paramSets)))
+
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        futures = [executor.submit(refitFile, f, sets, contourDir, cellSize) for f, sets in todo.items()]
+        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+            rows = future.result()
+            written = time.time()
+            for row in rows:
+                row['written'] = written
+            header = not os.path.exists(output)
+            pandas.DataFrame(rows, columns=COLUMNS).to_csv(output, mode='a', header=header, index=False)
+            failed = sum(1 for r in rows if 'error' in r)
+            logger.info('[{}/{}] {}{}'.format(i + 1, len(todo), rows[0]['file'],
+                                              ' ({} failed)'.format(failed) if failed else ''))
+
+    # Keep only the rows of the latest run of each recording and parameter set
+    table = readResults(output)
+    if table is not None:
+        temp = output + '.tmp'
+        table.to_csv(temp, index=False)
+        os.replace(temp, output)
+    return len(todo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Re-fit recorded strokes with other contour fitting parameters')
+    parser.add_argument('inputs', nargs='+', help='recordings (.xlsx), directories of recordings, or glob patterns')
+    parser.add_argument('-o', '--output', default='refit', help='directory for the results table and contours')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of processes (default: one per CPU)')
+    parser.add_argument('--restart', action='store_true', help='re-fit everything, not only new parameter sets')
+    parser.add_argument('--method', nargs='+', default=[fitting.BSPLINE], choices=[fitting.BSPLINE, fitting.DIRECT],
+                        help='fitting methods')
+    parser.add_argument('--simpleness', nargs='+', type=float, default=[5.0],
+                        help='simplification tolerances (bspline) or maximum errors (direct), in px')
+    parser.add_argument('--smoothness', nargs='+', type=float, default=[5.0], help='B-spline smoothing factors')
+    parser.add_argument('--cell-size', type=float, default=batch.DEFAULT_OPTIONS.cellSize,
+                        help='size in px of the cells of the masks used to score overlap')
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='[%(levelname)-8s] %(name)15s: %(message)s', level=logging.INFO)
+
+    filenames = batch.findRecordings(args.inputs)
+    if not filenames:
+        logger.error('No recordings found')
+        return 1
+    paramSets = parameterGrid(args.method, args.simpleness, args.smoothness)
+    run(filenames, args.output, paramSets, args.jobs, resume=not args.restart, cellSize=args.cell_size)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import os
+import shutil
+import threading
+import collections
+import concurrent.futures
+
+import numpy as np
+import pandas
+
+from gazecontour import diskcache
+from gazecontour.realtime import gazeSpeed
+from gazecontour.decimation import MinMaxPyramid
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Where converted sessions are kept
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.gazecontour', 'sessions')
+
+# Number of (time, speed) points kept in memory for the overview of a whole session
+OVERVIEW_POINTS = 8192
+
+
+def prepare(df):
+    """
+    Make recorded data ready for analysis: times in seconds from the first sample, and only
+    samples with a gaze position
+    """
+    df.index = pandas.to_datetime(df.index)
+    df['time'] = (df['time'] - df['time'][0]) / 1000.0
+    return df[df['raw_x'] != 0.0]
+
+
+def readSheet(workbook, index):
+    """
+    Return worksheet `index` of a pandas.ExcelFile as a DataFrame, or None if the workbook has
+    fewer sheets (e.g. recordings saved before the sheet was added)
+    """
+    if index >= len(workbook.sheet_names):
+        return None
+    return workbook.parse(workbook.sheet_names[index], index_col=None)
+
+
+class WindowedSession(object):
+    """
+    A recording session stored on disk, for sessions too long to load at once.
+
+    Each numeric column is a .npy file which is memory-mapped, not read. A coarse overview of
+    the gaze speed (its minima and maxima, see MinMaxPyramid) is kept in memory for the whole
+    session. Full-resolution data is read for a window of rows at a time, in chunks of
+    chunkRows rows, and the most recently used maxChunks chunks are kept. prefetch() reads the
+    chunks around a window in a background thread, so moving the window along (playing or
+    dragging) finds them ready.
+    """
+    def __init__(self, directory, chunkRows=65536, maxChunks=32):
+        self.directory = directory
+        self.chunkRows = chunkRows
+        self.maxChunks = maxChunks
+        with np.load(os.path.join(directory, 'overview.npz')) as f:
+            self.columns = [str(c) for c in f['columns']]
+            self.overviewTimes = f['times']
+            self.overviewSpeed = f['speed']
+        self._arrays = [np.load(os.path.join(directory, 'column_{}.npy'.format(i)), mmap_mode='r')
+                        for i in range(len(self.columns))]
+        self.times = self._arrays[self.columns.index('time')]
+        self.digest = os.path.basename(os.path.normpath(directory)) # identifies the session's data
+        self.duration = float(self.times[-1]) if len(self.times) else 0.0
+
+        self._chunks = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._prefetching = set()
+
+    @classmethod
+    def create(cls, df, directory):
+        """ Store the numeric columns of recorded data (see prepare) in directory """
+        df = prepare(df)
+        columns = [c for c in df.columns if df[c].dtype.kind in 'biuf']
+        temp = directory + '.tmp'
+        shutil.rmtree(temp, ignore_errors=True)
+        os.makedirs(temp)
+        for i, c in enumerate(columns):
+            np.save(os.path.join(temp, 'column_{}.npy'.format(i)), np.ascontiguousarray(df[c].values))
+
+        times = df['time'].values.astype(float)
+        speed = gazeSpeed(times, df['avg_x'].values, df['avg_y'].values)
+        samples = MinMaxPyramid(speed).indices(0, len(speed), OVERVIEW_POINTS)
+        np.savez(os.path.join(temp, 'overview.npz'), columns=np.array([str(c) for c in columns]),
+                 times=times[samples], speed=speed[samples])
+        shutil.rmtree(directory, ignore_errors=True)
+        os.rename(temp, directory)
+
+    @classmethod
+    def fromExcel(cls, filename, cacheDir=CACHE_DIR, **kwargs):
+        """
+        Open the gaze data of a saved recording, converting it the first time (the Excel file is
+        parsed only once, until it changes)
+        """
+        stat = os.stat(filename)
+        key = diskcache.digest(os.path.abspath(filename), stat.st_size, stat.st_mtime)
+        directory = os.path.join(cacheDir, key[:24])
+        if not os.path.exists(os.path.join(directory, 'overview.npz')):
+            logger.info('Converting {} for windowed loading'.format(filename))
+            os.makedirs(cacheDir, exist_ok=True)
+            cls.create(pandas.read_excel(filename, 0, index_col=None), directory)
+        return cls(directory, **kwargs)
+
+    def __len__(self):
+        return len(self.times)
+
+    def columnArrays(self):
+        """ Return the memory-mapped columns of the whole session, as {name: array} """
+        return collections.OrderedDict(zip(self.columns, self._arrays))
+
+    def rowRange(self, minSecs, maxSecs):
+        """ Return (start, stop): the rows recorded from minSecs to maxSecs """
+        return (int(np.searchsorted(self.times, minSecs, side='left')),
+                int(np.searchsorted(self.times, maxSecs, side='right')))
+
+    def window(self, start, stop, margin=1):
+        """
+        Read rows start to stop, extended to whole chunks and `margin` chunks either side.
+        Return (DataFrame, first row, stop row)
+        """
+        first = max(start // self.chunkRows - margin, 0)
+        last = min((max(stop, start + 1) - 1) // self.chunkRows + margin, self._chunkCount() - 1)
+        chunks = [self._chunk(i) for i in range(first, last + 1)]
+        data = collections.OrderedDict((c, np.concatenate([chunk[i] for chunk in chunks]))
+                                       for i, c in enumerate(self.columns))
+        return pandas.DataFrame(data), first * self.chunkRows, min((last + 1) * self.chunkRows, len(self))
+
+    def prefetch(self, start, stop, margin=2):
+        """ Start reading the chunks within `margin` chunks of rows start to stop, in the background """
+        first = max(start // self.chunkRows - margin, 0)
+        last = min((max(stop, start + 1) - 1) // self.chunkRows + margin, self._chunkCount() - 1)
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(1)
+        for i in range(first, last + 1):
+            with self._lock:
+                if i in self._chunks or i in self._prefetching:
+                    continue
+                self._prefetching.add(i)
+            self._executor.submit(self._chunk, i)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _chunkCount(self):
+        return max((len(self) + self.chunkRows - 1) // self.chunkRows, 1)
+
+    def _chunk(self, i):
+        """ Return chunk i as a list of column arrays, reading it if necessary """
+        with self._lock:
+            chunk = self._chunks.get(i)
+            if chunk is not None:
+                self._chunks.move_to_end(i)
+                return chunk
+        rows = slice(i * self.chunkRows, (i + 1) * self.chunkRows)
+        chunk = [np.array(a[rows]) for a in self._arrays]
+        with self._lock:
+            self._prefetching.discard(i)
+            self._chunks[i] = chunk
+            while len(self._chunks) > self.maxChunks:
+                self._chunks.popitem(last=False)
+        return chunk
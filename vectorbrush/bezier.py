@@ -5,6 +5,7 @@ import numpy as np
 import scipy
 
 from vectorbrush import geometry
+from vectorbrush.pathdata import PathData
 
 class BezierPath(QtGui.QPainterPath):
     """
@@ -13,7 +14,13 @@ class BezierPath(QtGui.QPainterPath):
     
     Used under the MIT license - see LICENSE.txt. 
     """
+    _pathData = None
     
+    def pathData(self):
+        """ The path as PathData, kept until the path is changed """
+        if self._pathData is None:
+            self._pathData = PathData.fromPainterPath(self)
+        return self._pathData
     
     def simplify(self, threshold):
         """
@@ -22,31 +29,7 @@ class BezierPath(QtGui.QPainterPath):
         """
         if self.elementCount() <= 2:
             return self
-
-        maximumDistance = 0.0
-        maximumIndex = 0
-
-        # Find the point the furtherest away
-        for i in range (1, self.elementCount()-1):
-            distance = geometry.distancePointToLine(self.pointAtIndex(i), self.pointAtIndex(0), self.pointAtIndex(self.elementCount() - 1));
-            if distance > maximumDistance:
-                maximumDistance = distance;
-                maximumIndex = i;
-        
-        if maximumDistance >= threshold:
-            #The distance is too great to simplify, so recurse
-            results1 = self.subpathWithRange(range(0, maximumIndex + 1)).simplify(threshold)
-            results2 = self.subpathWithRange(range(maximumIndex, self.elementCount())).simplify(threshold)
-
-            results1.appendPath(results2.subpathWithRange(range(1, results2.elementCount())))
-            return results1
-        else:
-            # The greatest distance from our end points isn't that much, so we can simplify
-            path = BezierPath();
-
-            path.moveTo(self.pointAtIndex(0))
-            path.lineTo(self.pointAtIndex(self.elementCount() - 1))
-            return path
+        return self.pathData().simplify(threshold).toPainterPath()
 
     def pointAtIndex(self, index):
         element = self.elementAt(index)
@@ -125,57 +108,36 @@ class BezierPath(QtGui.QPainterPath):
     
     def interpolateBSpline2(self, smoothness):
         """ simplfy the path using a b-spline and return fitted path"""
-        try:
-            tck, u = scipy.interpolate.splprep(self.getXY(), s=smoothness)
-        except TypeError:
-            raise Exception("Path too short (<3 points)")
-        
-        # Wrap Zachary Pincus's function and convert result to a QPainterPath
-        curves = geometry.b_spline_to_bezier_series(tck)
-        newPath = BezierPath()
-        newPath.moveTo(curves[0][0][0], curves[0][0][1])
-        for curve in curves:
-            newPath.cubicTo(curve[1][0], curve[1][1], curve[2][0], curve[2][1], curve[3][0], curve[3][1])
-        return newPath
+        return BezierPath.pathFromCurves(self.bSplineCurves(smoothness))
+    
+    def bSplineCurves(self, smoothness):
+        """ simplfy the path using a b-spline and return the Bezier curves as an Sx4x2 array """
+        return self.pathData().bSplineCurves(smoothness)
+    
+    @staticmethod
+    def pathFromCurves(curves):
+        """ Make a path from an Sx4x2 array of cubic Bezier control points """
+        return PathData.fromCurves(curves).toPainterPath()
     
-    def nearestPoint(self, targetPoint, threshold=1e-4, initialRes = 0.1):
+    def nearestPoint(self, targetPoint):
         """
-        Given a QPointF, return the (approximate) nearest point on the path.
+        Given a QPointF, return the nearest point on the path.
         """
-        t, _ =  self.nearestPointT(targetPoint, threshold, initialRes)
-        return self.pointAtPercent(t)
+        _, points, _ = self.pathData().nearest([(targetPoint.x(), targetPoint.y())])
+        return QtCore.QPointF(*points[0])
         
-    def nearestPointT(self, targetPoint, threshold=1e-4, initialRes = 0.1):
+    def nearestPointT(self, targetPoint):
         """
-        Given a QPointF, return the parameter t of the (approximate) nearest point on the path,
+        Given a QPointF, return the parameter t of the nearest point on the path (as for pointAtPercent),
         and the distance to that point.
-        Use a binary search as described here: http://pomax.github.io/bezierinfo/#projections
         """
-        # Begin with a reasonable guess based on linear search
-        ts = np.linspace(0,1,1/initialRes + 1)
-        initialDistances = [geometry.distanceBetweenPoints(targetPoint, self.pointAtPercent(t)) for t in ts]
-        ind = np.argmin(initialDistances)
-        t = ts[ind]
-        distance = initialDistances[ind]
-        interval = initialRes*2
-        
-        # Then the binary search
-        while interval > threshold:
-            tMinus = max(t - interval/2, 0)
-            tPlus = min(t + interval/2, 1)
-            distanceMinus = geometry.distanceBetweenPoints(targetPoint, self.pointAtPercent(tMinus))
-            distancePlus = geometry.distanceBetweenPoints(targetPoint, self.pointAtPercent(tPlus))
-            if distanceMinus < distance:
-                t = tMinus
-                distance = distanceMinus
-            elif distancePlus < distance:
-                t = tPlus
-                distance = distancePlus
-            else:
-                # Distance smallest at current t
-                interval /= 2
+        percents, _, distances = self.pathData().nearest([(targetPoint.x(), targetPoint.y())])
+        return percents[0], distances[0]
     
-        return t, distance
+    @staticmethod
+    def pathFromXY(xy):
+        """ Make a path of lineTo's from an Nx2 array of points """
+        return PathData.fromPoints(xy).toPainterPath()
     
     @staticmethod
     def pathFromPoints(points):
@@ -189,10 +151,8 @@ class BezierPath(QtGui.QPainterPath):
         return path
         
     def interpolateToPoints(self, n=None):
-        """ Split up the curve into points """
-        n = n or self.length()
-        ts = np.linspace(0, 1, n)
-        return [self.pointAtPercent(t) for t in ts]
+        """ Split up the curve into points, evenly spaced along its length """
+        return [QtCore.QPointF(x, y) for x, y in self.pathData().resample(n)]
         
     @staticmethod
     def warpPoints(points, target, delta, strength, radius, falloff='cos'):
@@ -200,41 +160,17 @@ class BezierPath(QtGui.QPainterPath):
         Take an array of QPointFs and warp them radially toward a target
         target = QPointF, current cursor position
         delta = QPointF, last movement in cursor position
-        strength = scale of effect (0 to 1)
-        radius = maximum distance of influence
-        falloff = function used to calculate influence ('linear' or 'cos2')
+        (see geometry.warpPoints for the other arguments)
         
         Return new points (do not change in place)
         """
-        
-        newPoints = []
-        for p in points:
-            # line from target to p
-            dist = geometry.distanceBetweenPoints(p, target)
-            if dist < radius:
-                # Calculate size of effect
-                if falloff is 'cos':
-                    m = strength*(np.cos(np.pi*dist/radius)+1)/2
-                else:
-                    m = strength*(1 - dist/radius)
-                
-                # Move the point in the direction of the delta
-                newPoints.append(p + m*delta)
-            else:
-                newPoints.append(p)
-        return newPoints
-        
-        
-        
+        xy = geometry.warpPoints(geometry.xyFromPoints(points), (target.x(), target.y()), (delta.x(), delta.y()),
+                                 strength, radius, falloff)
+        return [QtCore.QPointF(x, y) for x, y in xy]
 
     def getXY(self):
         """ Return the x and y points of each element in this path as a list of arrays """
-        x = []
-        y = []
-        for element in self.elements():
-            x.append(element.x)
-            y.append(element.y)
-        return [x,y]
+        return list(self.pathData().points.T)
 
 
     def elements(self):
@@ -242,13 +178,37 @@ class BezierPath(QtGui.QPainterPath):
         for i in range(self.elementCount()):
             yield self.elementAt(i)
 
+# QPainterPath methods which change the path, and so the cached PathData of a BezierPath
+_MUTATORS = ('moveTo', 'lineTo', 'cubicTo', 'quadTo', 'arcTo', 'closeSubpath', 'setElementPositionAt',
+             'translate', 'addPath', 'connectPath', 'addEllipse', 'addRect', 'addPolygon', 'setFillRule')
+
+def _invalidating(name):
+    method = getattr(QPainterPath, name)
+    def mutator(self, *args):
+        self._pathData = None
+        return method(self, *args)
+    mutator.__name__ = name
+    mutator.__doc__ = method.__doc__
+    return mutator
+
+for _name in _MUTATORS:
+    setattr(BezierPath, _name, _invalidating(_name))
+
 class BezierPathItem(QtGui.QGraphicsPathItem):
 
-    def __init__(self, path, parent=None, scene=None):
+    def __init__(self, path, parent=None, scene=None, handles=True):
         super().__init__(path, parent, scene)
         self.handles = dict()
         
-        self.makeHandles()
+        # Called as onElementsMoved(item, indices, oldPositions, newPositions) when handles are dragged
+        self.onElementsMoved = None
+        
+        # The points this path was last fitted to (Nx2 array), if any
+        self.sourcePoints = None
+        self._pathData = None
+        
+        if handles:
+            self.makeHandles()
         
         self.setPen(QtGui.QPen(QtGui.QColor('lightseagreen'), 1))
 
@@ -287,9 +247,38 @@ class BezierPathItem(QtGui.QGraphicsPathItem):
     def bezierPath(self):
         return BezierPath(super().path())
     
+    def setPath(self, path):
+        self._pathData = None
+        super().setPath(path)
+    
+    def pathData(self):
+        """ The path as PathData, kept until the path is changed """
+        if self._pathData is None:
+            self._pathData = PathData.fromPainterPath(self.path())
+        return self._pathData
+    
     def updateAll(self):
         for k in self.handles.values():
             k.update()
+    
+    def translateElements(self, indices, offsets):
+        """ Move elements of the path by (dx, dy) offsets, and their handles """
+        path = self.path()
+        for i, (dx, dy) in zip(indices, offsets):
+            el = path.elementAt(i)
+            path.setElementPositionAt(i, el.x + dx, el.y + dy)
+        self.setPath(path)
+        self.updateHandles(indices)
+    
+    def updateHandles(self, indices):
+        """ Move the given handles to match their elements, after the path was changed externally """
+        for i in indices:
+            if i in self.handles:
+                self.handles[i].updateHandle()
+    
+    def elementsMoved(self, indices, old, new):
+        if self.onElementsMoved is not None:
+            self.onElementsMoved(self, indices, old, new)
                 
 
 class HandleItem(QtGui.QGraphicsObject):
@@ -318,6 +307,7 @@ class HandleItem(QtGui.QGraphicsObject):
         self.setFlag(G.ItemSendsGeometryChanges)
         self.setAcceptHoverEvents(True)
         self.setZValue(self.Z_MAX)
+        self._syncing = False
         
         self.highlightColor = QtGui.QColor('orange')
         self.highlightScale = 2
@@ -372,29 +362,37 @@ class HandleItem(QtGui.QGraphicsObject):
         return super().mouseReleaseEvent(event)
                    
     def itemChange (self, change, value):
-        if change == QtGui.QGraphicsItem.ItemPositionHasChanged and self.isSelected():
+        if change == QtGui.QGraphicsItem.ItemPositionHasChanged and self.isSelected() and not self._syncing:
             # Move this point and its control handles (unless it's an endpoint)
             path = self.parentItem().path()
             
             newPos = self.pos() # item has already moved with the mouse
             posDelta = newPos - QtCore.QPointF(path.elementAt(self.index).x, path.elementAt(self.index).y)
             
-            path.setElementPositionAt(self.index, newPos.x(), newPos.y())
+            indices = [self.index]
             if self.index>0 and self.index < path.elementCount()-1:
-                for i in [self.index-1, self.index+1]:
-                    newX = posDelta.x() + path.elementAt(i).x
-                    newY = posDelta.y() + path.elementAt(i).y
-                    path.setElementPositionAt(i, newX, newY)
-                    
-                    # update the display of the handles
-                    self.parentItem().handles[i].updateHandle()
+                indices += [self.index-1, self.index+1]
+            old = [(path.elementAt(i).x, path.elementAt(i).y) for i in indices]
+            
+            path.setElementPositionAt(self.index, newPos.x(), newPos.y())
+            for i in indices[1:]:
+                newX = posDelta.x() + path.elementAt(i).x
+                newY = posDelta.y() + path.elementAt(i).y
+                path.setElementPositionAt(i, newX, newY)
+                
+                # update the display of the handles
+                self.parentItem().handles[i].updateHandle()
             self.parentItem().setPath(path)
+            self.parentItem().elementsMoved(indices, old, [(path.elementAt(i).x, path.elementAt(i).y) for i in indices])
         return value
         
         
     def updateHandle(self):
+        """ Move to the position of the element, without moving any other elements """
         el = self.parentItem().path().elementAt(self.index)
+        self._syncing = True
         self.setPos(el.x, el.y)
+        self._syncing = False
 
 
 class ControlHandleItem(HandleItem):
@@ -428,15 +426,20 @@ class ControlHandleItem(HandleItem):
         super().mouseMoveEvent(*args)  
         
     def itemChange (self, change, value):
-        if change == QtGui.QGraphicsItem.ItemPositionHasChanged and self.isSelected():
+        if change == QtGui.QGraphicsItem.ItemPositionHasChanged and self.isSelected() and not self._syncing:
             # Move this control point and its partner (unless it's on an endpoint)
             # Use semi-constrained motion
             path = self.parentItem().path()
             
+            indices = [self.index]
+            if self.masterIndex>0 and self.masterIndex < path.elementCount()-1:
+                indices.append(self.partnerIndex)
+            old = [(path.elementAt(i).x, path.elementAt(i).y) for i in indices]
+            
             newPos = self.pos() # item has already moved with the mouse
             path.setElementPositionAt(self.index, newPos.x(), newPos.y())
     
-            if self.masterIndex>0 and self.masterIndex < path.elementCount()-1:
+            if len(indices) > 1:
                 # Want the partner point to have the opposite angle from the master
                 lineFromMaster = QtCore.QLineF(self.elementPosAt(self.masterIndex), newPos)
                 angleFromMaster = lineFromMaster.angle() # angle in degrees
@@ -451,5 +454,6 @@ class ControlHandleItem(HandleItem):
                 # update the display of the handles
                 self.parentItem().handles[self.partnerIndex].updateHandle()
             self.parentItem().setPath(path)
+            self.parentItem().elementsMoved(indices, old, [(path.elementAt(i).x, path.elementAt(i).y) for i in indices])
         
         return value
@@ -0,0 +1,59 @@
+import collections
+import hashlib
+
+import numpy as np
+
+
+class FitCache(object):
+    """
+    Least-recently-used cache of contour fits.
+
+    Entries are keyed on a hash of the input point array together with the fit parameters, and
+    hold the fitted Sx4x2 array of Bezier curves. Once the cached curves take up more than
+    maxBytes, the least recently used entries are evicted.
+    """
+    def __init__(self, maxBytes=16*1024*1024):
+        self.maxBytes = maxBytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    @staticmethod
+    def key(points, *params):
+        """ Return a cache key for an Nx2 array of points and the parameters used to fit it """
+        points = np.ascontiguousarray(points, dtype=float)
+        digest = hashlib.sha1(points.tobytes()).hexdigest()
+        return (digest, points.shape) + tuple(params)
+
+    def get(self, key):
+        """ Return the cached curves for key, or None """
+        curves = self._entries.get(key)
+        if curves is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return curves
+
+    def put(self, key, curves):
+        curves = np.asarray(curves)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old.nbytes
+        self._entries[key] = curves
+        self.nbytes += curves.nbytes
+
+        while self.nbytes > self.maxBytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,252 @@
+"""
+Contour fitting functions which take and return plain arrays, so they can be run in worker processes.
+"""
+import collections
+
+import numpy as np
+
+from vectorbrush import geometry
+from vectorbrush.pathdata import PathData
+
+# Fitting methods for fitContour
+BSPLINE = 'bspline'
+DIRECT = 'direct'
+
+
+def fitContour(points, simpleness, smoothness, method=BSPLINE):
+    """
+    Fit cubic Bezier curves to a stroke given as an Nx2 array of points. Return the curves as an
+    Sx4x2 array of control points.
+    
+    method = BSPLINE: simplify the stroke with Ramer-Douglas-Peucker (tolerance simpleness), then
+             fit a smoothing B-spline (smoothness)
+    method = DIRECT: fit the fewest curves which stay within simpleness of every point (see
+             fitCubicBeziers); smoothness is not used
+    """
+    if method == DIRECT:
+        return fitCubicBeziers(points, simpleness).curves
+    return PathData.fromPoints(points).simplify(simpleness).bSplineCurves(smoothness)
+
+
+class FitResult(collections.namedtuple('FitResult', 'curves residual breaks')):
+    """
+    Result of fitCubicBeziers:
+        curves = Sx4x2 array of Bezier control points
+        residual = largest distance between a point and its position on the fitted curve
+        breaks = indices of the points where the curves start and end (length S+1)
+    """
+    @property
+    def segments(self):
+        return len(self.curves)
+
+
+def fitCubicBeziers(points, maxError, maxIterations=4, startTangent=None, endTangent=None):
+    """
+    Fit a piecewise cubic Bezier curve directly to an Nx2 array of points, so that no point is
+    further than maxError from the curve.
+    
+    This is Philip Schneider's algorithm ("An Algorithm for Automatically Fitting Digitized
+    Curves", Graphics Gems, 1990): parameterize the points by chord length and fit one cubic by
+    least squares; if the error is close to the bound, improve the parameters with Newton's
+    method and re-fit; otherwise, split at the worst point and fit both halves, keeping the
+    tangent continuous. This gives few curves for the tolerance.
+    
+    startTangent, endTangent = unit vectors to use for the tangents at the ends (pointing into
+    the curve), instead of estimating them from the points.
+    
+    Return a FitResult.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    
+    # Repeated points have no direction and would give zero-length chords
+    keep = np.concatenate([[True], np.any(np.diff(points, axis=0) != 0, axis=1)])
+    originalIndices = np.flatnonzero(keep)
+    points = points[keep]
+    if len(points) < 2:
+        raise ValueError('Cannot fit a curve to fewer than 2 distinct points')
+    
+    if startTangent is None:
+        startTangent = _unit(points[1] - points[0])
+    if endTangent is None:
+        endTangent = _unit(points[-2] - points[-1])
+    
+    # Fit ranges of points from an explicit stack, left to right
+    curves = []
+    breaks = [0]
+    residual = 0.0
+    stack = [(0, len(points) - 1, np.asarray(startTangent, dtype=float), np.asarray(endTangent, dtype=float))]
+    while stack:
+        first, last, tangent1, tangent2 = stack.pop()
+        curve, error, split = _fitCubic(points[first:last + 1], tangent1, tangent2, maxError, maxIterations)
+        if curve is not None:
+            curves.append(curve)
+            breaks.append(last)
+            residual = max(residual, error)
+        else:
+            split += first
+            centerTangent = _unit(points[split - 1] - points[split + 1])
+            stack.append((split, last, -centerTangent, tangent2))
+            stack.append((first, split, tangent1, centerTangent))
+    
+    return FitResult(np.array(curves), residual, originalIndices[breaks])
+
+
+def _unit(v):
+    length = np.hypot(v[0], v[1])
+    return v / length if length > 0 else v
+
+
+def _fitCubic(points, tangent1, tangent2, maxError, maxIterations):
+    """
+    Fit one cubic to the points. Return (curve, error, None) if it is within maxError, or else
+    (None, error, split) with the index of the point to split at.
+    """
+    if len(points) == 2:
+        # Straight line, with control points a third of the way along
+        third = np.hypot(*(points[1] - points[0])) / 3
+        curve = np.array([points[0], points[0] + tangent1 * third, points[1] + tangent2 * third, points[1]])
+        return curve, 0.0, None
+    
+    u = _chordLengthParameters(points)
+    curve = _leastSquaresCubic(points, u, tangent1, tangent2)
+    error, split = _maxError(points, curve, u)
+    if error < maxError:
+        return curve, error, None
+    
+    # If the error is not too large, try reparameterizing
+    if error < 4 * maxError:
+        for _ in range(maxIterations):
+            u = _newtonReparameterize(points, curve, u)
+            curve = _leastSquaresCubic(points, u, tangent1, tangent2)
+            error, split = _maxError(points, curve, u)
+            if error < maxError:
+                return curve, error, None
+    
+    return None, error, split
+
+
+def _chordLengthParameters(points):
+    chords = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(points, axis=0).T))])
+    return chords / chords[-1]
+
+
+def _leastSquaresCubic(points, u, tangent1, tangent2):
+    """ Find the control points along the end tangents which best fit the points at parameters u """
+    B = geometry.bernsteinMatrix(u)
+    first, last = points[0], points[-1]
+    A1 = B[:, 1, np.newaxis] * tangent1
+    A2 = B[:, 2, np.newaxis] * tangent2
+    
+    C = np.array([[np.sum(A1 * A1), np.sum(A1 * A2)],
+                  [np.sum(A1 * A2), np.sum(A2 * A2)]])
+    rest = points - np.outer(B[:, 0] + B[:, 1], first) - np.outer(B[:, 2] + B[:, 3], last)
+    X = np.array([np.sum(A1 * rest), np.sum(A2 * rest)])
+    
+    det = C[0, 0] * C[1, 1] - C[0, 1] * C[1, 0]
+    if det != 0:
+        alpha1 = (X[0] * C[1, 1] - X[1] * C[0, 1]) / det
+        alpha2 = (C[0, 0] * X[1] - C[1, 0] * X[0]) / det
+    else:
+        alpha1 = alpha2 = 0
+    
+    # If the fit is degenerate, fall back on the heuristic used for two points
+    chord = np.hypot(*(last - first))
+    if alpha1 < 1e-6 * chord or alpha2 < 1e-6 * chord:
+        alpha1 = alpha2 = chord / 3
+    return np.array([first, first + tangent1 * alpha1, last + tangent2 * alpha2, last])
+
+
+def _maxError(points, curve, u):
+    """ Return the largest distance of a point from its position on the curve, and the index of that point """
+    offsets = geometry.bezierPoints(curve[np.newaxis], u)[0] - points
+    distances = np.hypot(offsets[:, 0], offsets[:, 1])
+    split = np.argmax(distances[1:-1]) + 1
+    return distances.max(), split
+
+
+def _newtonReparameterize(points, curve, u):
+    """ One Newton-Raphson step toward the parameters of the nearest points on the curve """
+    a, b, c, d = [x[0] for x in geometry._powerCoefficients(curve[np.newaxis])]
+    T = u[:, np.newaxis]
+    offset = ((a*T + b)*T + c)*T + d - points
+    velocity = (3*a*T + 2*b)*T + c
+    numerator = np.sum(offset * velocity, axis=1)
+    denominator = np.sum(velocity * velocity, axis=1) + np.sum(offset * (6*a*T + 2*b), axis=1)
+    step = numerator / np.where(denominator != 0, denominator, 1) * (denominator != 0)
+    return np.clip(u - step, 0, 1)
+
+
+class StreamingFitter(object):
+    """
+    Fits Bezier curves (as fitCubicBeziers) to a stroke while it is being drawn.
+    
+    Points are fed in one at a time with addPoint, e.g. from mouse moves or gaze fixations. Every
+    refitInterval points the tail of the stroke which is not yet committed is re-fitted, and all of
+    its curves except the last are committed: later points can no longer change them. The tail is
+    kept to at most maxTail points, so each re-fit, and the final fit in finish(), takes a bounded
+    time however long the stroke is.
+    """
+    def __init__(self, maxError, refitInterval=16, maxTail=200):
+        self.maxError = maxError
+        self.refitInterval = refitInterval
+        self.maxTail = maxTail
+        self.points = [] # the whole stroke
+        self._curves = [] # committed curves
+        self._breaks = [0] # indices of the points where the committed curves start and end
+        self._residual = 0.0
+        self._tangent = None # unit tangent at the end of the committed curves
+        self._sinceFit = 0
+    
+    def addPoint(self, x, y):
+        if self.points and self.points[-1] == (x, y):
+            return
+        self.points.append((x, y))
+        self._sinceFit += 1
+        if self._sinceFit >= self.refitInterval:
+            self._sinceFit = 0
+            self._commit()
+    
+    def addPoints(self, points):
+        for x, y in points:
+            self.addPoint(x, y)
+    
+    def finish(self):
+        """ Fit the remaining tail, and return all the curves of the stroke as a FitResult """
+        start = self._breaks[-1]
+        curves, breaks, residual = list(self._curves), list(self._breaks), self._residual
+        if len(self.points) - start >= 2:
+            result = fitCubicBeziers(self.points[start:], self.maxError, startTangent=self._tangent)
+            curves.extend(result.curves)
+            breaks.extend(start + result.breaks[1:])
+            residual = max(residual, result.residual)
+        elif not curves:
+            raise ValueError('Cannot fit a curve to fewer than 2 distinct points')
+        return FitResult(np.array(curves), residual, np.array(breaks))
+    
+    def _commit(self):
+        start = self._breaks[-1]
+        tail = self.points[start:]
+        if len(tail) < 4:
+            return
+        result = fitCubicBeziers(tail, self.maxError, startTangent=self._tangent)
+        if len(result.curves) > 1:
+            self._accept(result.curves[:-1], start + result.breaks[1:-1], result.residual)
+        elif len(tail) > self.maxTail:
+            # One curve still fits the whole tail; commit a fit of its first half to keep the tail short
+            half = len(tail) // 2
+            result = fitCubicBeziers(tail[:half + 1], self.maxError, startTangent=self._tangent)
+            self._accept(result.curves, start + result.breaks[1:], result.residual)
+    
+    def _accept(self, curves, ends, residual):
+        """ Commit curves, which end at the points with indices `ends` """
+        self._curves.extend(curves)
+        self._breaks.extend(ends)
+        self._residual = max(self._residual, residual)
+        # The end tangent points from the last control point which differs from the end point;
+        # if the curve is a single point, the next fit takes its tangent from the stroke
+        last = curves[-1]
+        self._tangent = None
+        for control in (last[2], last[1], last[0]):
+            if np.hypot(*(last[3] - control)) > 1e-12:
+                self._tangent = _unit(last[3] - control)
+                break
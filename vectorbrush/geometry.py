@@ -1,10 +1,7 @@
 import math
 import numpy as np
-import scipy.interpolate.fitpack as fitpack
 
 
-from PySide import QtCore, QtGui
-
 def distanceBetweenPoints(point1, point2):
     return math.hypot(point2.x() - point1.x(), point2.y() - point1.y())
 
@@ -17,74 +14,295 @@ def distancePointToLine(point, lineStartPoint, lineEndPoint):
 
     return distanceBetweenPoints(point, intersectionPoint)
 
+def simplifyIndices(points, threshold):
+    """
+    Simplify a polyline using the Ramer-Douglas-Peucker algorithm.
+    points = Nx2 array, threshold = maximum distance of a removed point from the simplified line
+    
+    Return the sorted indices of the points to keep. The ranges still to be split are kept on an
+    explicit stack (no recursion), and the distances for each range are computed at once.
+    """
+    points = np.asarray(points, dtype=float)
+    n = len(points)
+    if n <= 2:
+        return np.arange(n)
+    
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        
+        # Perpendicular distance of each point from the line through the endpoints
+        chord = points[last] - points[first]
+        chordLength = math.hypot(chord[0], chord[1])
+        if chordLength == 0:
+            continue
+        offsets = points[first + 1:last] - points[first]
+        distances = np.abs(offsets[:, 0] * chord[1] - offsets[:, 1] * chord[0]) / chordLength
+        
+        i = np.argmax(distances)
+        if distances[i] >= threshold:
+            # The distance is too great to simplify, so split at the furthest point
+            i += first + 1
+            keep[i] = True
+            stack.append((first, i))
+            stack.append((i, last))
+    return np.flatnonzero(keep)
+
 
 def b_spline_to_bezier_series(tck, per=False):
     """Convert a parametric b-spline into a sequence of Bezier curves of the same degree.
     
-    By Zachary Pincus, from http://mail.scipy.org/pipermail/scipy-dev/2007-February/006651.html
+    Interface by Zachary Pincus, from http://mail.scipy.org/pipermail/scipy-dev/2007-February/006651.html
+    His version inserted knots one at a time (quadratic in the number of knots); this one computes
+    the control points of every Bezier curve at once, by blossoming -LK
     
     Inputs:
         tck : (t,c,k) tuple of b-spline knots, coefficients, and degree returned by splprep.
         per : if tck was created as a periodic spline, per *must* be true, else per *must* be false.
     
     Output:
-        A list of Bezier curves of degree k that is equivalent to the input spline.
-        Each Bezier curve is an array of shape (k+1,d) where d is the dimension of the
-        space; thus the curve includes the starting point, the k-1 internal control
-        points, and the endpoint, where each point is of d dimensions.
+        An array of Bezier curves of degree k that is equivalent to the input spline, of shape
+        (S,k+1,d) where d is the dimension of the space; thus each curve includes the starting
+        point, the k-1 internal control points, and the endpoint, where each point is of d dimensions.
     """
     t, c, k = tck
-    t = np.asarray(t)
+    t = np.asarray(t, dtype=float)
     try:
         c[0][0]
     except:
         # I can't figure out a simple way to convert nonparametric splines to
         # parametric splines. Oh well.
         raise TypeError("Only parametric b-splines are supported.")
-    new_tck = tck
-    if per:
-        # ignore the leading and trailing k knots that exist to enforce periodicity
-        knots_to_consider = np.unique(t[k:-k])
-    else:
-        # the first and last k+1 knots are identical in the non-periodic case, so
-        # no need to consider them when increasing the knot multiplicities below
-        knots_to_consider = np.unique(t[k + 1:-k - 1])
-    # For each np.unique knot, bring it's multiplicity up to the next multiple of k+1
-    # This removes all continuity constraints between each of the original knots,
-    # creating a set of independent Bezier curves.
-    desired_multiplicity = k + 1
-    for x in knots_to_consider:
-        current_multiplicity = np.sum(t == x)
-        remainder = current_multiplicity % desired_multiplicity
-        if remainder != 0:
-            # add enough knots to bring the current multiplicity up to the desired multiplicity
-            number_to_insert = desired_multiplicity - remainder
-            new_tck = fitpack.insert(x, new_tck, number_to_insert, per)
-    tt, cc, kk = new_tck
-    # strip off the last k+1 knots, as they are redundant after knot insertion
-    # correction: except for short curves -LK
-    bezier_points = np.transpose(cc)
-    if len(bezier_points)>desired_multiplicity:
-        bezier_points = bezier_points[:-desired_multiplicity]
-        
-    if per:
-        # again, ignore the leading and trailing k knots
-        bezier_points = bezier_points[k:-k]
-    # group the points into the desired bezier curves
-    return np.split(bezier_points, len(bezier_points) / desired_multiplicity, axis=0)
+    c = np.transpose(np.asarray(c, dtype=float))
+    
+    # Each non-empty knot span [t[j], t[j+1]] of the domain is one Bezier curve. (For a periodic
+    # spline, the leading and trailing k knots are outside the domain, as in the non-periodic case.)
+    # Repeated knots give empty spans, so multiplicities need no special treatment.
+    j = np.arange(k, len(t) - k - 1)
+    j = j[t[j] < t[j + 1]]
+    a, b = t[j], t[j + 1]
+    
+    # Control point i of the curve on [a, b] is the blossom of the span's polynomial at
+    # (a, ..., a, b, ..., b) with k-i a's and i b's. Evaluate all of them at once with de Boor's
+    # algorithm, starting from the k+1 coefficients which are non-zero on the span.
+    i = np.arange(k + 1)
+    args = np.where(np.arange(k)[np.newaxis, :] < (k - i)[:, np.newaxis], a[:, np.newaxis, np.newaxis], b[:, np.newaxis, np.newaxis])
+    points = np.repeat(c[j[:, np.newaxis] + np.arange(-k, 1)][:, np.newaxis], k + 1, axis=1)
+    for level in range(1, k + 1):
+        r = j[:, np.newaxis] + np.arange(level - k, 1)
+        left, right = t[r], t[r + k + 1 - level]
+        alpha = ((args[:, :, level - 1, np.newaxis] - left[:, np.newaxis]) / (right - left)[:, np.newaxis])[..., np.newaxis]
+        points = (1 - alpha) * points[:, :, :-1] + alpha * points[:, :, 1:]
+    return points[:, :, 0]
    
 def areaOfPolygon(points):
     """
     Return area enclosed by points, assuming it is a simple polygon.
     See http://mathworld.wolfram.com/PolygonArea.html
     """
-    x,y = zip(*points)
-    A = np.sum(x[n]*y[n+1] - x[n+1]*y[n] for n in range(len(x)-1))/2
-    return abs(A)
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    x, y = points[:, 0], points[:, 1]
+    return abs(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)) / 2
 
-def xyFromPoints(points, offset=QtCore.QPointF(0,0)):
+def xyFromPoints(points, offset=None):
     """ Return list of point tuples from sequence of QPointF """
-    return [(p.x() + offset.x(), p.y() + offset.y()) for p in points]
+    ox, oy = (offset.x(), offset.y()) if offset is not None else (0, 0)
+    return [(p.x() + ox, p.y() + oy) for p in points]
+
+def warpPoints(points, target, delta, strength, radius, falloff='cos'):
+    """
+    Warp an Nx2 array of points radially toward a target
+    target = (x, y), current cursor position
+    delta = (dx, dy), last movement in cursor position
+    strength = scale of effect (0 to 1)
+    radius = maximum distance of influence
+    falloff = function used to calculate influence ('cos' or 'linear')
+    
+    Return new points (do not change in place)
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    dist = np.hypot(points[:, 0] - target[0], points[:, 1] - target[1])
+    
+    # Calculate size of effect
+    if falloff == 'cos':
+        m = strength*(np.cos(np.pi*dist/radius)+1)/2
+    else:
+        m = strength*(1 - dist/radius)
+    m[dist >= radius] = 0
+    
+    # Move the points in the direction of the delta
+    return points + m[:, np.newaxis] * np.asarray(delta, dtype=float)
+
+def linesToCurves(starts, ends):
+    """ Return the Sx4x2 array of cubic Bezier curves equivalent to the lines between starts and ends (Sx2 arrays) """
+    starts = np.asarray(starts, dtype=float)
+    ends = np.asarray(ends, dtype=float)
+    t = np.array([0, 1/3, 2/3, 1])[np.newaxis, :, np.newaxis]
+    return starts[:, np.newaxis] + t * (ends - starts)[:, np.newaxis]
+
+def bernsteinMatrix(t):
+    """ Cubic Bernstein basis evaluated at parameters t: array of shape len(t) x 4 """
+    t = np.asarray(t, dtype=float)[:, np.newaxis]
+    s = 1 - t
+    return np.hstack([s**3, 3*t*s**2, 3*t**2*s, t**3])
+
+def bezierPoints(curves, t):
+    """
+    Evaluate every cubic Bezier curve in an Sx4x2 array at the parameters t.
+    Return an array of shape S x len(t) x 2.
+    """
+    return np.einsum('kj,sjd->skd', bernsteinMatrix(t), curves)
+
+def bezierPointsAt(curves, indices, t):
+    """ Evaluate the cubic Bezier curves curves[indices] (from an Sx4x2 array) at the parameters t; return an Nx2 array """
+    p = curves[indices]
+    t = np.asarray(t, dtype=float)[:, np.newaxis]
+    s = 1 - t
+    return s**3*p[:, 0] + 3*t*s**2*p[:, 1] + 3*t**2*s*p[:, 2] + t**3*p[:, 3]
+
+def flattenCurves(curves, tolerance):
+    """
+    Approximate a series of cubic Bezier curves (Sx4x2 array) by a polyline which deviates from
+    them by at most tolerance. Return the polyline as an Nx2 array.
+    
+    Each curve is split into as many pieces as its own flatness requires (by Wang's formula: the
+    bound on the second derivative gives the number of uniform pieces needed for the tolerance),
+    so straight curves become single lines and tight ones are divided finely. All curves are
+    then evaluated at once through the Bernstein basis.
+    """
+    curves = np.asarray(curves, dtype=float)
+    if len(curves) == 0:
+        return np.empty((0, 2))
+    
+    secondDifferences = curves[:, :2] - 2*curves[:, 1:3] + curves[:, 2:]
+    M = np.hypot(secondDifferences[..., 0], secondDifferences[..., 1]).max(axis=1)
+    pieces = np.maximum(np.ceil(np.sqrt(0.75 * M / tolerance)), 1).astype(int)
+    
+    # Parameters k/n for k = 0..n-1 on each curve, then the last endpoint
+    indices = np.repeat(np.arange(len(curves)), pieces)
+    starts = np.cumsum(pieces) - pieces
+    t = (np.arange(len(indices)) - starts[indices]) / pieces[indices]
+    return np.concatenate([bezierPointsAt(curves, indices, t), curves[-1:, 3]])
+
+def _powerCoefficients(curves):
+    """ Coefficients (a, b, c, d) of Sx4x2 cubic Bezier curves written as a*t**3 + b*t**2 + c*t + d (each Sx2) """
+    p0, p1, p2, p3 = curves[:, 0], curves[:, 1], curves[:, 2], curves[:, 3]
+    return (p3 - p0 + 3*(p1 - p2), 3*(p0 - 2*p1 + p2), 3*(p1 - p0), p0)
+
+def bezierLengths(curves, t=1, order=16):
+    """
+    Arc lengths of Sx4x2 cubic Bezier curves from parameter 0 to t (a scalar or one per curve),
+    by Gauss-Legendre quadrature.
+    """
+    curves = np.asarray(curves, dtype=float)
+    a, b, c, _ = _powerCoefficients(curves)
+    nodes, weights = np.polynomial.legendre.leggauss(order)
+    t = np.ones(len(curves)) * t
+    u = ((nodes + 1) / 2 * t[:, np.newaxis])[..., np.newaxis]
+    du = (3*a[:, np.newaxis]*u + 2*b[:, np.newaxis])*u + c[:, np.newaxis]
+    return np.hypot(du[..., 0], du[..., 1]).dot(weights) * t / 2
+
+# Green's theorem for a cubic Bezier curve: (1/2) * integral of (x dy - y dx) = x . K . y, where
+# x and y are the control point coordinates (K is exact; it is the antisymmetric part of the
+# integrals of each Bernstein basis function times the derivative of another)
+_AREA_MATRIX = np.array([[ 0,  6,  3,  1],
+                         [-6,  0,  3,  3],
+                         [-3, -3,  0,  6],
+                         [-1, -3, -6,  0]]) / 20
+
+def bezierAreas(curves):
+    """
+    Signed areas swept by Sx4x2 cubic Bezier curves, by Green's theorem: the sum over a closed
+    series of curves is the area it encloses, positive when the curves run counterclockwise in
+    y-up coordinates (clockwise on screen). Exact.
+    """
+    curves = np.asarray(curves, dtype=float)
+    return np.einsum('si,ij,sj->s', curves[..., 0], _AREA_MATRIX, curves[..., 1])
+
+def bezierMoments(curves):
+    """
+    First moments of area swept by Sx4x2 cubic Bezier curves (as for bezierAreas): an Sx2 array
+    whose sum over a closed series of curves is the integral of (x, y) over the enclosed area.
+    Integrates x**2 dy / 2 and -y**2 dx / 2 by Gauss-Legendre quadrature, which is exact for
+    these degree 8 polynomials.
+    """
+    curves = np.asarray(curves, dtype=float)
+    nodes, weights = np.polynomial.legendre.leggauss(5)
+    t = (nodes + 1) / 2
+    points = bezierPoints(curves, t)
+    a, b, c, _ = _powerCoefficients(curves)
+    u = t[:, np.newaxis]
+    velocity = (3*a[:, np.newaxis]*u + 2*b[:, np.newaxis])*u + c[:, np.newaxis]
+    mx = (points[..., 0]**2 * velocity[..., 1]).dot(weights) / 4
+    my = -(points[..., 1]**2 * velocity[..., 0]).dot(weights) / 4
+    return np.column_stack([mx, my])
+
+def nearestPointOnCurves(curves, queries, starts=8, iterations=8, chunkSize=2**20):
+    """
+    Find the nearest point on a series of cubic Bezier curves (Sx4x2 array) to each of the query
+    points (Qx2 array).
+    
+    Curves whose control point bounding box is further from a query than the nearest curve endpoint
+    are skipped. On the others, the squared distance is minimized by Newton's method on each curve's
+    polynomial, from several starting parameters at once; the best result over all curves is the
+    global nearest point.
+    
+    Return (indices, t, points, distances): for each query, the index of the nearest curve, the
+    parameter on that curve, the nearest point (as a Qx2 array) and its distance.
+    """
+    curves = np.asarray(curves, dtype=float)
+    queries = np.asarray(queries, dtype=float).reshape(-1, 2)
+    if len(curves) == 0:
+        raise ValueError('No curves to find the nearest point on')
+    
+    # Limit the size of the query x curve arrays
+    n = max(1, chunkSize // max(len(curves), 1))
+    results = [_nearestPointOnCurves(curves, queries[i:i+n], starts, iterations) for i in range(0, len(queries), n)]
+    if not results:
+        return np.empty(0, dtype=int), np.empty(0), np.empty((0, 2)), np.empty(0)
+    return tuple(np.concatenate(r) for r in zip(*results))
+
+def _nearestPointOnCurves(curves, queries, starts, iterations):
+    a, b, c, d = _powerCoefficients(curves)
+    
+    # The bounding box contains the curve, so its distance is a lower bound for the curve's distance.
+    # The endpoints are on the curve, so the distance to the nearest one is an upper bound.
+    gap = np.maximum(np.maximum(curves.min(axis=1) - queries[:, np.newaxis], queries[:, np.newaxis] - curves.max(axis=1)), 0)
+    lower = np.hypot(gap[..., 0], gap[..., 1])
+    endDistances = [np.hypot(*(queries[:, np.newaxis] - curves[:, i]).transpose(2, 0, 1)) for i in (0, 3)]
+    upper = np.minimum(*endDistances).min(axis=1)
+    qi, ci = np.nonzero(lower <= upper[:, np.newaxis])
+    
+    # Newton's method for the roots of (B(t) - q).B'(t), from several starts per curve
+    A, B, C, D = [x[ci][:, np.newaxis] for x in (a, b, c, d)]
+    q = queries[qi][:, np.newaxis]
+    t = np.tile(np.linspace(0, 1, starts), (len(qi), 1))
+    for _ in range(iterations):
+        T = t[..., np.newaxis]
+        offset = ((A*T + B)*T + C)*T + D - q
+        velocity = (3*A*T + 2*B)*T + C
+        f = (offset * velocity).sum(axis=-1)
+        df = (velocity**2).sum(axis=-1) + (offset * (6*A*T + 2*B)).sum(axis=-1)
+        # Only step where the distance is convex, i.e. toward a minimum
+        convex = df > 0
+        t = np.clip(t - convex * f / np.where(convex, df, 1), 0, 1)
+    
+    T = t[..., np.newaxis]
+    offset = ((A*T + B)*T + C)*T + D - q
+    distances = np.hypot(offset[..., 0], offset[..., 1])
     
+    # Best start for each (query, curve) pair, then best pair for each query
+    k = np.argmin(distances, axis=1)
+    t = t[np.arange(len(k)), k]
+    distances = distances[np.arange(len(k)), k]
+    order = np.lexsort((distances, qi))
+    first = order[np.concatenate([[True], qi[order][1:] != qi[order][:-1]])]
     
-    
\ No newline at end of file
+    indices, t, distances = ci[first], t[first], distances[first]
+    T = t[:, np.newaxis]
+    points = ((a[indices]*T + b[indices])*T + c[indices])*T + d[indices]
+    return indices, t, points, distances
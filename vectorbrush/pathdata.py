@@ -0,0 +1,258 @@
+import numpy as np
+import scipy.interpolate
+
+from vectorbrush import geometry
+
+# Element types, with the same values as QPainterPath.ElementType
+MOVE_TO, LINE_TO, CURVE_TO, CURVE_TO_DATA = range(4)
+
+
+class PathData(object):
+    """
+    A path stored in plain numpy arrays, mirroring the elements of a QPainterPath:
+        points = Nx2 float array of element positions
+        types = length N int8 array of element types (MOVE_TO, LINE_TO, CURVE_TO, CURVE_TO_DATA)
+    A cubic segment is a CURVE_TO element (first control point) followed by two CURVE_TO_DATA
+    elements (second control point and end point), as in Qt.
+
+    Simplifying, fitting, sampling and warping all work on the arrays, without Qt, so paths can be
+    processed in worker processes. Convert with fromPainterPath/toPainterPath only for display.
+    """
+
+    def __init__(self, points=None, types=None):
+        self.points = np.ascontiguousarray(np.empty((0, 2)) if points is None else points, dtype=float).reshape(-1, 2)
+        if types is None:
+            # a polyline
+            types = np.full(len(self.points), LINE_TO, dtype=np.int8)
+            types[:1] = MOVE_TO
+        self.types = np.asarray(types, dtype=np.int8)
+        self._arcTable = None
+
+    @classmethod
+    def fromPoints(cls, points):
+        """ Make a polyline through an Nx2 array of points """
+        return cls(points)
+
+    @classmethod
+    def fromCurves(cls, curves):
+        """ Make a path from an Sx4x2 array of cubic Bezier control points (each curve starting where the last ended) """
+        curves = np.asarray(curves, dtype=float)
+        points = np.concatenate([curves[:1, 0], curves[:, 1:].reshape(-1, 2)])
+        types = np.empty(len(points), dtype=np.int8)
+        types[0] = MOVE_TO
+        types[1::3] = CURVE_TO
+        types[2::3] = CURVE_TO_DATA
+        types[3::3] = CURVE_TO_DATA
+        return cls(points, types)
+
+    @classmethod
+    def fromPainterPath(cls, path):
+        """ Copy the elements of a QPainterPath """
+        n = path.elementCount()
+        points = np.empty((n, 2))
+        types = np.empty(n, dtype=np.int8)
+        for i in range(n):
+            el = path.elementAt(i)
+            points[i] = el.x, el.y
+            types[i] = int(el.type)
+        return cls(points, types)
+
+    def toPainterPath(self, pathClass=None):
+        """ Build a QPainterPath (by default a BezierPath) with the same elements """
+        if pathClass is None:
+            from vectorbrush.bezier import BezierPath as pathClass
+        path = pathClass()
+        points, types = self.points, self.types
+        i = 0
+        while i < len(types):
+            if types[i] == MOVE_TO:
+                path.moveTo(points[i, 0], points[i, 1])
+            elif types[i] == LINE_TO:
+                path.lineTo(points[i, 0], points[i, 1])
+            elif types[i] == CURVE_TO:
+                (x1, y1), (x2, y2), (x, y) = points[i:i+3]
+                path.cubicTo(x1, y1, x2, y2, x, y)
+                i += 2
+            i += 1
+        return path
+
+    def __len__(self):
+        return len(self.points)
+
+    @property
+    def nbytes(self):
+        return self.points.nbytes + self.types.nbytes
+
+    def invalidate(self):
+        """ Discard cached values; call this after modifying points or types in place """
+        self._arcTable = None
+
+    def copy(self):
+        return PathData(self.points.copy(), self.types.copy())
+
+    def isPolyline(self):
+        return len(self.types) > 0 and self.types[0] == MOVE_TO and bool(np.all(self.types[1:] == LINE_TO))
+
+    def isCubic(self):
+        """ Whether the path is a single run of cubic curves """
+        t = self.types
+        return (len(t) >= 4 and len(t) % 3 == 1 and t[0] == MOVE_TO and bool(np.all(t[1::3] == CURVE_TO))
+                and bool(np.all(t[2::3] == CURVE_TO_DATA)) and bool(np.all(t[3::3] == CURVE_TO_DATA)))
+
+    def curves(self):
+        """
+        Return the segments of the path as an Sx4x2 array of cubic Bezier control points.
+        Lines are converted to equivalent cubics. For a path made only of curves this is a view of
+        self.points (no copy), so it must not be modified.
+        """
+        points = self.points
+        if self.isCubic():
+            s0, s1 = points.strides
+            return np.lib.stride_tricks.as_strided(points, shape=((len(points) - 1) // 3, 4, 2), strides=(3*s0, s0, s1))
+        if self.isPolyline():
+            return geometry.linesToCurves(points[:-1], points[1:])
+
+        curves = []
+        i = 1
+        while i < len(points):
+            if self.types[i] == LINE_TO:
+                curves.append(geometry.linesToCurves(points[i-1:i], points[i:i+1])[0])
+            elif self.types[i] == CURVE_TO:
+                curves.append(points[i-1:i+3])
+                i += 2
+            i += 1
+        return np.array(curves).reshape(-1, 4, 2)
+
+    def length(self):
+        lengths, _ = self._arcLengths()
+        return lengths[-1]
+
+    def area(self, signed=False):
+        """
+        Area enclosed by the path, exactly (see geometry.bezierAreas). Each subpath is closed by a
+        straight line if it does not end where it started.
+        """
+        area = np.sum(geometry.bezierAreas(self._closedCurves()))
+        return area if signed else abs(area)
+
+    def centroid(self):
+        """ Centroid (x, y) of the area enclosed by the path, closed as for area() """
+        curves = self._closedCurves()
+        area = np.sum(geometry.bezierAreas(curves))
+        if area == 0:
+            return self.points.mean(axis=0) if len(self.points) else np.zeros(2)
+        return geometry.bezierMoments(curves).sum(axis=0) / area
+
+    def pointAtPercent(self, percents):
+        """ Return the points (Nx2) at the given fractions of the path's length """
+        lengths, _ = self._arcLengths()
+        return self.pointAtLength(np.asarray(percents, dtype=float) * lengths[-1])
+
+    def pointAtLength(self, distances):
+        """ Return the points (Nx2) at the given distances along the path """
+        lengths, samples = self._arcLengths()
+        curves = self.curves()
+        distances = np.atleast_1d(np.asarray(distances, dtype=float))
+        if len(curves) == 0:
+            return np.repeat(self.points[:1], len(distances), axis=0)
+
+        # Find the table interval containing each distance, and interpolate the curve parameter in it
+        j = np.clip(np.searchsorted(lengths, distances, side='right') - 1, 0, len(lengths) - 2)
+        span = lengths[j + 1] - lengths[j]
+        fraction = np.clip((distances - lengths[j]) / np.where(span > 0, span, 1), 0, 1)
+        position = (j + fraction) / samples
+        indices = np.minimum(position.astype(int), len(curves) - 1)
+        return geometry.bezierPointsAt(curves, indices, position - indices)
+
+    def lengthAt(self, indices, t):
+        """ Return the distances along the path to parameters t on the curves with the given indices """
+        lengths, samples = self._arcLengths()
+        position = (np.asarray(indices) + np.asarray(t, dtype=float)) * samples
+        j = np.clip(position.astype(int), 0, len(lengths) - 2)
+        return lengths[j] + (position - j) * (lengths[j + 1] - lengths[j])
+
+    def nearest(self, queries):
+        """
+        Find the nearest points on the path to each of the query points (Qx2 array).
+        Return (percents, points, distances): the positions along the path as fractions of its
+        length (as for QPainterPath.pointAtPercent), the nearest points (Qx2) and their distances.
+        """
+        indices, t, points, distances = geometry.nearestPointOnCurves(self.curves(), queries)
+        total = self.length()
+        percents = self.lengthAt(indices, t) / total if total > 0 else np.zeros(len(t))
+        return np.clip(percents, 0, 1), points, distances
+
+    def resample(self, n=None):
+        """
+        Return n points (Nx2 array) spaced evenly by arc length along the path.
+        By default, use about one point per unit of length.
+        """
+        total = self.length()
+        n = int(total if n is None else n)
+        return self.pointAtLength(np.linspace(0, total, n))
+
+    def flatten(self, tolerance=0.25):
+        """
+        Return the path as a polyline (Nx2 array) within tolerance of it, with points only where
+        the curvature needs them (see geometry.flattenCurves).
+        """
+        if self.isPolyline() or len(self.points) < 2:
+            return self.points
+        return geometry.flattenCurves(self.curves(), tolerance)
+
+    def simplify(self, threshold):
+        """
+        Simplify the path's points using the Ramer-Douglas-Peucker algorithm and return a polyline.
+        Only meaningful for polylines (curve control points are treated as points on the line).
+        """
+        if len(self.points) <= 2:
+            return self
+        return PathData(self.points[geometry.simplifyIndices(self.points, threshold)])
+
+    def bSplineCurves(self, smoothness):
+        """ Fit a smoothing B-spline through the path's points and return it as an Sx4x2 array of Bezier curves """
+        try:
+            tck, u = scipy.interpolate.splprep(self.points.T, s=smoothness)
+        except TypeError:
+            raise Exception("Path too short (<3 points)")
+
+        # Wrap Zachary Pincus's function
+        return np.array(geometry.b_spline_to_bezier_series(tck))
+
+    def fitBSpline(self, smoothness):
+        return PathData.fromCurves(self.bSplineCurves(smoothness))
+
+    def warp(self, target, delta, strength, radius, falloff='cos'):
+        """ Return a copy of the path with its points warped (see geometry.warpPoints) """
+        return PathData(geometry.warpPoints(self.points, target, delta, strength, radius, falloff), self.types.copy())
+
+    def _closedCurves(self):
+        """ The path's curves, with lines added from the end of each subpath back to its start """
+        if len(self.points) == 0:
+            return np.empty((0, 4, 2))
+        starts = np.flatnonzero(self.types == MOVE_TO)
+        if len(starts) == 0 or starts[0] != 0:
+            starts = np.concatenate([[0], starts])
+        ends = np.append(starts[1:] - 1, len(self.points) - 1)
+        return np.concatenate([self.curves(), geometry.linesToCurves(self.points[ends], self.points[starts])])
+
+    def _arcLengths(self, samplesPerCurve=16):
+        """
+        Lookup table of cumulative arc length, built when first needed and kept until invalidate().
+        Return (lengths, samples): lengths[j] is the length of the path up to parameter
+        (j % samples) / samples of curve j // samples, and the last entry is the total length.
+        Lines are exactly linear in their parameter, so polylines need only one sample per line.
+        """
+        if self._arcTable is None:
+            curves = self.curves()
+            if self.isPolyline():
+                samples = 1
+                lengths = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(self.points, axis=0).T))])
+            else:
+                samples = samplesPerCurve
+                curveLengths = geometry.bezierLengths(curves)
+                starts = np.concatenate([[0], np.cumsum(curveLengths)])
+                partial = geometry.bezierLengths(np.repeat(curves, samples, axis=0), np.tile(np.arange(samples) / samples, len(curves)))
+                lengths = np.append(np.repeat(starts[:-1], samples) + partial, starts[-1])
+            self._arcTable = (lengths, samples)
+        return self._arcTable